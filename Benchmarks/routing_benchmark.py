@@ -0,0 +1,112 @@
+from Network.street_graph import StreetGraph
+from Regression.synthetic_graph import write_synthetic_graph_cache
+from simulator import load_environment, ENVIRONMENT_FILE_PATH
+
+import argparse
+import statistics
+import tempfile
+import time
+from random import Random
+
+import networkx as nx
+
+
+def get_route_length(graph, route):
+    """
+    Length of a route, using the shortest of any parallel edges.
+    :param graph: (NetworkX MultiDiGraph)
+    :param route: (List[OSMNX Node])
+    :return: (Float) Meters
+    """
+    length = 0
+    for u, v in zip(route[:-1], route[1:]):
+        length += min(float(data["length"]) for data in graph[u][v].values())
+
+    return length
+
+
+def time_routes(route_function, od_pairs):
+    """
+    Time a routing function over OD pairs, skipping pairs with no path.
+    :param route_function: (Function) (origin, destination) -> route
+    :param od_pairs: (List[(OSMNX Node, OSMNX Node)])
+    :return: (List[Float], Dictionary) Seconds per query and routes by OD pair
+    """
+    timings = []
+    routes = {}
+
+    for origin, destination in od_pairs:
+        start = time.perf_counter()
+        try:
+            routes[(origin, destination)] = route_function(origin, destination)
+        except nx.NetworkXNoPath:
+            continue
+        timings.append(time.perf_counter() - start)
+
+    return timings, routes
+
+
+def print_timings(name, timings):
+    """
+    Print mean / median / p95 query time in milliseconds.
+    :param name: (String)
+    :param timings: (List[Float]) Seconds per query
+    :return:
+    """
+    timings = sorted(timings)
+    p95 = timings[int(0.95 * (len(timings) - 1))]
+
+    print(f"{name}:")
+    print(f"\tMean: {1000 * statistics.mean(timings):.3f}ms Median: {1000 * statistics.median(timings):.3f}ms P95: {1000 * p95:.3f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare contraction hierarchy routing against NetworkX on the same OD pairs.")
+    parser.add_argument("--env", default=ENVIRONMENT_FILE_PATH, help="Environment JSON file")
+    parser.add_argument("--pairs", type=int, default=1000, help="Number of OD pairs")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for picking OD pairs")
+    parser.add_argument("--grid", type=int, nargs=2, metavar=("ROWS", "COLUMNS"),
+                        help="Route on a synthetic street grid instead of the downloaded region")
+    parser.add_argument("--diagonal-chance", type=float, default=0.0, help="Chance each grid block gets a diagonal street")
+    parser.add_argument("--street-nodes", type=int, default=0, help="Extra nodes along every grid street, like an unsimplified graph")
+    args = parser.parse_args()
+
+    env_vars = load_environment(args.env)
+    env_vars["USE_CONTRACTION_HIERARCHY"] = True
+
+    if args.grid is not None:
+        # Fresh cache directory, so neither the grid nor its hierarchy is mistaken for a downloaded region
+        env_vars["USE_GRAPH_CACHE"] = True
+        env_vars["GRAPH_CACHE_DIRECTORY"] = tempfile.mkdtemp(prefix="routing_benchmark_")
+        write_synthetic_graph_cache(env_vars, {
+            "rows": args.grid[0],
+            "columns": args.grid[1],
+            "spacing_meters": 100,
+            "diagonal_chance": args.diagonal_chance,
+            "street_nodes": args.street_nodes
+        })
+
+    street_graph = StreetGraph(env_vars)
+    graph = street_graph.graph
+    print(f"Graph: {graph.number_of_nodes()} nodes, {graph.number_of_edges()} edges")
+
+    rand = Random(args.seed)
+    od_pairs = [(rand.choice(street_graph.ox_nodes_list), rand.choice(street_graph.ox_nodes_list)) for _ in range(args.pairs)]
+
+    hop_timings, _ = time_routes(lambda o, d: nx.shortest_path(graph, o, d), od_pairs)
+    dijkstra_timings, dijkstra_routes = time_routes(lambda o, d: nx.shortest_path(graph, o, d, weight="length"), od_pairs)
+    hierarchy_timings, hierarchy_routes = time_routes(street_graph.contraction_hierarchy.shortest_path, od_pairs)
+
+    print_timings("nx.shortest_path (unweighted)", hop_timings)
+    print_timings("nx.shortest_path (length)", dijkstra_timings)
+    print_timings("ContractionHierarchy", hierarchy_timings)
+
+    mismatches = 0
+    for od_pair, route in dijkstra_routes.items():
+        if od_pair not in hierarchy_routes:
+            mismatches += 1
+        elif abs(get_route_length(graph, route) - get_route_length(graph, hierarchy_routes[od_pair])) > 1e-6:
+            mismatches += 1
+
+    print(f"Routes Compared: {len(dijkstra_routes)} Length Mismatches: {mismatches}")
+    print(f"Speedup over weighted Dijkstra: {statistics.mean(dijkstra_timings) / statistics.mean(hierarchy_timings):.1f}x")
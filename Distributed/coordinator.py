@@ -0,0 +1,320 @@
+from Distributed.protocol import Connection
+from Network.street_graph import StreetGraph, NETWORK_TYPES, get_graph_cache_path, get_hierarchy_cache_path
+from Radar.radar_requests import RadarRequests
+from simulator import load_environment, get_travel_mode_counts, ENVIRONMENT_FILE_PATH
+
+import argparse
+import base64
+import os
+import socketserver
+import threading
+import time
+import uuid
+
+
+def split_traveller_ranges(total_users, range_count):
+    """
+    Split traveller indices [0, total_users) into contiguous ranges of near equal size.
+    :param total_users: (Int) Total Travellers in the run
+    :param range_count: (Int) Number of ranges
+    :return: (List[[Int, Int]]) [start, end) ranges. Empty ranges are left out.
+    """
+    ranges = []
+    range_size, remainder = divmod(total_users, range_count)
+
+    start = 0
+    for range_index in range(0, range_count):
+        end = start + range_size + (1 if range_index < remainder else 0)
+        if end > start:
+            ranges.append([start, end])
+        start = end
+
+    return ranges
+
+
+class WorkerHandler(socketserver.BaseRequestHandler):
+    """
+    One thread per connected worker. All state lives on the Coordinator.
+    """
+
+    def handle(self):
+        coordinator = self.server.coordinator
+        coordinator.handle_worker(Connection(self.request, timeout=coordinator.worker_setup_timeout))
+
+
+class Coordinator:
+    """
+    Owns the environment, the graph cache and the geofences for a distributed run and hands traveller index ranges to workers.
+    Workers are sent the cached graph files with their config, so every worker routes on the same graph as the Coordinator.
+    Workers that stop sending heartbeats are dropped and their ranges are handed to the next worker that asks.
+    """
+
+    server = None
+    stopping = False
+
+    def __init__(self, env, radar_requests=None):
+        """
+        :param env: (Dictionary) Environment variables
+        :param radar_requests: (RadarRequests) Where geofences are retrieved from. Defaults to the Radar API.
+        """
+        # The graph cache is what workers are sent, so it is always on
+        self.env = dict(env, USE_GRAPH_CACHE=True)
+        self.radar_requests = radar_requests
+
+        self.host = env["COORDINATOR_HOST"]
+        self.port = env["COORDINATOR_PORT"]
+        self.worker_timeout = env["WORKER_TIMEOUT_SECONDS"]
+        self.worker_setup_timeout = env["WORKER_SETUP_TIMEOUT_SECONDS"]
+        self.max_run_time = env["MAX_RUN_TIME_SECONDS"]
+
+        self.run_id = uuid.uuid4().hex[:8]
+        self.geofences = []
+        self.tower_cords = []
+        self.graph_cache_files = {}
+
+        self.pending_ranges = split_traveller_ranges(env["TOTAL_SIM_USERS"], env["DISTRIBUTED_WORKER_COUNT"])
+
+        # worker_id -> {"ranges": [[start, end]], "metrics": {...}, "status": "running" | "finished" | "lost"}
+        self.workers = {}
+        self.next_worker_id = 0
+
+        self.lock = threading.Lock()
+        self.stopping = False
+
+    def prepare(self):
+        """
+        Build (or load) the cached street graph of every travel mode and retrieve the geofences so workers only have to read them.
+        Towers are placed once here, like Simulator does across travel modes, so every worker's Travellers see the same towers.
+        :return:
+        """
+        street_graph = None
+        for travel_mode, count in get_travel_mode_counts(self.env).items():
+            if count == 0:
+                continue
+
+            if street_graph is None:
+                street_graph = StreetGraph(self.env, travel_mode)
+                self.tower_cords = street_graph.tower_cords.tolist()
+            else:
+                street_graph = StreetGraph(self.env, travel_mode, tower_cords=self.tower_cords)
+
+            self.graph_cache_files.update(self.read_graph_cache_files(NETWORK_TYPES[travel_mode]))
+
+        if self.radar_requests is None:
+            self.radar_requests = RadarRequests(self.env)
+
+        self.geofences = self.radar_requests.get_simulation_geofences(street_graph.focal_point,
+                                                                 street_graph.graph_size_in_meters,
+                                                                 default_geofence_radius=self.env["DEFAULT_GEOFENCE_RADIUS_METERS"])
+
+    def read_graph_cache_files(self, network_type):
+        """
+        Read the cached graph of a network type, and its contraction hierarchy when one is used, to send to workers.
+        :param network_type: (String) OSMNX network type
+        :return: (Dictionary) File name -> Base64 file contents
+        """
+        paths = [get_graph_cache_path(self.env, network_type)]
+        if self.env["USE_CONTRACTION_HIERARCHY"]:
+            paths.append(get_hierarchy_cache_path(self.env, network_type))
+
+        graph_cache_files = {}
+        for path in paths:
+            with open(path, "rb") as cache_file:
+                graph_cache_files[os.path.basename(path)] = base64.b64encode(cache_file.read()).decode("ascii")
+
+        return graph_cache_files
+
+    def start(self):
+        """
+        Start accepting workers on a background thread.
+        :return:
+        """
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self.server = socketserver.ThreadingTCPServer((self.host, self.port), WorkerHandler)
+        self.server.daemon_threads = True
+        self.server.coordinator = self
+
+        # Port 0 picks a free port
+        self.port = self.server.server_address[1]
+
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        print(f"Coordinator {self.run_id} listening on {self.host}:{self.port}")
+
+    def run(self):
+        """
+        Main run function for a distributed simulation.
+        (1) Prepare the shared graph cache and geofences
+        (2) Accept workers until the run time is over
+        (3) Stop the workers and report
+        :return:
+        """
+        self.prepare()
+        self.start()
+
+        run_clock = time.time()
+        while time.time() - run_clock < self.max_run_time:
+            time.sleep(1)
+
+        self.stop()
+        self.print_report()
+
+    def stop(self):
+        """
+        Tell workers to stop on their next heartbeat and wait for them to finish.
+        :return:
+        """
+        self.stopping = True
+
+        stop_clock = time.time()
+        while self.get_running_worker_count() > 0 and time.time() - stop_clock < self.worker_timeout:
+            time.sleep(0.1)
+
+        self.server.shutdown()
+        self.server.server_close()
+
+    def handle_worker(self, connection: Connection):
+        """
+        Serve one worker until it finishes or is lost.
+        Building a Simulator can take much longer than a heartbeat, so until the worker's first heartbeat it gets
+        WORKER_SETUP_TIMEOUT_SECONDS instead of WORKER_TIMEOUT_SECONDS.
+        :param connection: (Connection) Worker connection
+        :return:
+        """
+        worker_id = None
+
+        try:
+            message = connection.receive()
+            if message is None or message["type"] != "register":
+                return
+
+            with self.lock:
+                worker_id = self.next_worker_id
+                self.next_worker_id += 1
+                self.workers[worker_id] = {"ranges": [], "metrics": {}, "status": "running"}
+                assign = self.take_pending_range(worker_id)
+
+            print(f"\tWorker {worker_id} registered with ranges {assign}")
+            connection.send({
+                "type": "config",
+                "worker_id": worker_id,
+                "run_id": self.run_id,
+                # Workers must use the graph files sent here, never a graph of their own
+                "env": dict(self.env, DOWNLOAD_MISSING_GRAPH=False),
+                "geofences": self.geofences,
+                "tower_cords": self.tower_cords,
+                "graph_cache": self.graph_cache_files,
+                "assign": assign
+            })
+
+            while True:
+                message = connection.receive()
+                if message is None:
+                    break
+
+                connection.set_timeout(self.worker_timeout)
+
+                with self.lock:
+                    self.workers[worker_id]["metrics"] = message["metrics"]
+
+                    if message["type"] == "finished":
+                        self.workers[worker_id]["status"] = "finished"
+                        break
+
+                    if self.stopping:
+                        reply = {"type": "stop"}
+                    else:
+                        reply = {"type": "ack", "assign": self.take_pending_range(worker_id)}
+
+                connection.send(reply)
+        except (OSError, ValueError):
+            # Timeouts, resets and garbled messages all count as losing the worker
+            pass
+        finally:
+            connection.close()
+            if worker_id is not None:
+                self.release_worker(worker_id)
+
+    def take_pending_range(self, worker_id):
+        """
+        Give a worker the next unassigned traveller range, if there is one. Caller must hold the lock.
+        :param worker_id: (Int)
+        :return: (List[[Int, Int]]) Newly assigned ranges
+        """
+        if len(self.pending_ranges) == 0:
+            return []
+
+        traveller_range = self.pending_ranges.pop(0)
+        self.workers[worker_id]["ranges"].append(traveller_range)
+
+        return [traveller_range]
+
+    def release_worker(self, worker_id):
+        """
+        Mark a worker as lost unless it finished, putting its traveller ranges back up for assignment.
+        :param worker_id: (Int)
+        :return:
+        """
+        with self.lock:
+            worker = self.workers[worker_id]
+            if worker["status"] != "running":
+                return
+
+            worker["status"] = "lost"
+            self.pending_ranges.extend(worker["ranges"])
+
+        print(f"\tWorker {worker_id} lost. Reassigning ranges {worker['ranges']}")
+
+    def get_running_worker_count(self):
+        """
+        :return: (Int) Workers still running
+        """
+        with self.lock:
+            return len([worker for worker in self.workers.values() if worker["status"] == "running"])
+
+    def get_report(self):
+        """
+        Totals of the last metrics every worker sent, including lost workers.
+        :return: (Dictionary) Report
+        """
+        with self.lock:
+            report = {
+                "workers": len(self.workers),
+                "lost_workers": 0,
+                "unassigned_ranges": list(self.pending_ranges),
+                "track_calls": 0,
+                "fixed_rate_track_calls": 0,
+                "trips_started": 0,
+                "trips_completed": 0
+            }
+
+            for worker in self.workers.values():
+                if worker["status"] == "lost":
+                    report["lost_workers"] += 1
+
+                report["track_calls"] += worker["metrics"].get("track_calls", 0)
+                report["fixed_rate_track_calls"] += worker["metrics"].get("fixed_rate_track_calls", 0)
+                report["trips_started"] += worker["metrics"].get("trips_started", 0)
+                report["trips_completed"] += worker["metrics"].get("trips_completed", 0)
+
+        return report
+
+    def print_report(self):
+        """
+        Print the distributed run report.
+        :return:
+        """
+        report = self.get_report()
+
+        print(f"Workers: {report['workers']} ({report['lost_workers']} lost)")
+        print(f"\tUnassigned Ranges: {report['unassigned_ranges']}")
+        print(f"Track Calls: {report['track_calls']} (Fixed Rate: {report['fixed_rate_track_calls']})")
+        print(f"Trips Started: {report['trips_started']} Completed: {report['trips_completed']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the coordinator for a distributed simulation.")
+    parser.add_argument("--env", default=ENVIRONMENT_FILE_PATH, help="Environment JSON file")
+    args = parser.parse_args()
+
+    C = Coordinator(load_environment(args.env))
+    C.run()
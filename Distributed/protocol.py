@@ -0,0 +1,59 @@
+import json
+import socket
+
+
+class Connection:
+    """
+    Newline delimited JSON messages over a TCP socket. Shared by the coordinator and its workers.
+
+    Worker -> Coordinator
+        {"type": "register"}
+        {"type": "heartbeat", "metrics": {...}}   The first is sent as soon as the worker's Simulator is built
+        {"type": "finished", "metrics": {...}}
+
+    Coordinator -> Worker
+        {"type": "config", "worker_id": Int, "run_id": String, "env": {...}, "geofences": [...],
+         "tower_cords": [[lat, long], ...], "graph_cache": {file_name: base64, ...}, "assign": [[start, end], ...]}
+        {"type": "ack", "assign": [[start, end], ...]}
+        {"type": "stop"}
+    """
+
+    def __init__(self, sock: socket.socket, timeout=None):
+        self.sock = sock
+        self.sock.settimeout(timeout)
+        self.reader = self.sock.makefile("r", encoding="utf-8")
+
+    def send(self, message):
+        """
+        Send one message.
+        :param message: (Dictionary) JSON serializable message
+        :return:
+        """
+        self.sock.sendall((json.dumps(message) + "\n").encode("utf-8"))
+
+    def set_timeout(self, timeout):
+        """
+        Change how long send and receive may block before raising socket.timeout.
+        :param timeout: (Float) Seconds. None blocks forever.
+        :return:
+        """
+        self.sock.settimeout(timeout)
+
+    def receive(self):
+        """
+        Block until the next message arrives.
+        :return: (Dictionary) Message. None if the other side closed the connection.
+        """
+        line = self.reader.readline()
+        if not line:
+            return None
+
+        return json.loads(line)
+
+    def close(self):
+        """
+        Close the connection.
+        :return:
+        """
+        self.reader.close()
+        self.sock.close()
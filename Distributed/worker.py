@@ -0,0 +1,152 @@
+from Distributed.protocol import Connection
+from simulator import Simulator, load_environment, ENVIRONMENT_FILE_PATH
+
+import argparse
+import base64
+import os
+import socket
+import time
+
+
+class Worker:
+    """
+    Runs the Simulator loop for the traveller ranges a Coordinator assigns, sending heartbeats with metrics back to it.
+    The environment, geofences, towers, run ID and the cached street graph files all come from the Coordinator.
+    """
+
+    simulator = None
+    worker_id = None
+    connection = None
+
+    heartbeat_frequency = 0
+    last_heartbeat_clock = 0
+
+    def __init__(self, host, port, timeout=None, radar_requests=None, graph_cache_directory=None):
+        """
+        :param host: (String) Coordinator host
+        :param port: (Int) Coordinator port
+        :param timeout: (Float) Seconds to wait on the Coordinator until its config arrives. Afterwards its WORKER_TIMEOUT_SECONDS is used.
+        :param radar_requests: (RadarRequests) Where requests are sent. Defaults to the Radar API.
+        :param graph_cache_directory: (String) Where the Coordinator's graph files are written. Defaults to its GRAPH_CACHE_DIRECTORY.
+        """
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.radar_requests = radar_requests
+        self.graph_cache_directory = graph_cache_directory
+
+    def run(self):
+        """
+        Main run function for a worker.
+        (1) Register with the Coordinator and build a Simulator from its config
+        (2) Update Travellers, sending a heartbeat every WORKER_HEARTBEAT_SECONDS
+        (3) Stop when told to, when the Coordinator goes away or at the max run time
+        :return:
+        """
+        connection = Connection(socket.create_connection((self.host, self.port), timeout=self.timeout), timeout=self.timeout)
+        self.connection = connection
+
+        try:
+            connection.send({"type": "register"})
+            config = connection.receive()
+        except OSError:
+            connection.close()
+            print("Coordinator did not send a config.")
+            return
+
+        if config is None:
+            connection.close()
+            print("Coordinator closed the connection before sending a config.")
+            return
+
+        self.worker_id = config["worker_id"]
+        env_vars = config["env"]
+        self.heartbeat_frequency = env_vars["WORKER_HEARTBEAT_SECONDS"]
+
+        # A hung Coordinator must not block the update loop forever
+        connection.set_timeout(env_vars["WORKER_TIMEOUT_SECONDS"])
+
+        if self.graph_cache_directory is not None:
+            env_vars = dict(env_vars, GRAPH_CACHE_DIRECTORY=self.graph_cache_directory)
+        self.write_graph_cache_files(env_vars["GRAPH_CACHE_DIRECTORY"], config["graph_cache"])
+
+        self.simulator = Simulator(env_vars=env_vars, geofences=config["geofences"], traveller_id_range=[0, 0],
+                                   run_id=config["run_id"], radar_requests=self.radar_requests, tower_cords=config["tower_cords"])
+        self.assign(config["assign"])
+
+        run_clock = time.time()
+
+        try:
+            # Tells the Coordinator setup is done, however long it took
+            running = self.heartbeat(connection)
+
+            while running and time.time() - run_clock < self.simulator.max_run_time:
+                time.sleep(self.simulator.run_throttle)  # Throttle Update Loop
+
+                self.simulator.update_travellers()
+
+                delta_time_since_last_heartbeat = time.time() - self.last_heartbeat_clock
+                if delta_time_since_last_heartbeat >= self.heartbeat_frequency:
+                    running = self.heartbeat(connection)
+
+            connection.send({"type": "finished", "metrics": self.simulator.get_metrics()})
+        except OSError:
+            print(f"Worker {self.worker_id} lost the Coordinator.")
+        finally:
+            connection.close()
+
+        self.simulator.finish()
+
+    def write_graph_cache_files(self, graph_cache_directory, graph_cache_files):
+        """
+        Write the Coordinator's cached graph files, replacing any local copies so the worker routes on the same graph.
+        :param graph_cache_directory: (String) Graph cache directory
+        :param graph_cache_files: (Dictionary) File name -> Base64 file contents
+        :return:
+        """
+        os.makedirs(graph_cache_directory, exist_ok=True)
+
+        for file_name, contents in graph_cache_files.items():
+            # Only bare file names, the Coordinator must not write outside the cache directory
+            with open(os.path.join(graph_cache_directory, os.path.basename(file_name)), "wb") as cache_file:
+                cache_file.write(base64.b64decode(contents))
+
+    def heartbeat(self, connection: Connection):
+        """
+        Send metrics to the Coordinator and pick up any newly assigned ranges.
+        :param connection: (Connection) Coordinator connection
+        :return: (Bool) Keep running
+        """
+        connection.send({"type": "heartbeat", "metrics": self.simulator.get_metrics()})
+        reply = connection.receive()
+        self.last_heartbeat_clock = time.time()
+
+        if reply is None:
+            raise ConnectionResetError("Coordinator closed the connection")
+        elif reply["type"] == "stop":
+            return False
+
+        self.assign(reply["assign"])
+        return True
+
+    def assign(self, traveller_ranges):
+        """
+        Add Travellers for newly assigned ranges.
+        :param traveller_ranges: (List[[Int, Int]]) [start, end) traveller index ranges
+        :return:
+        """
+        for start_index, end_index in traveller_ranges:
+            print(f"Worker {self.worker_id} assigned Travellers [{start_index}, {end_index})")
+            self.simulator.add_travellers(start_index, end_index)
+
+
+if __name__ == "__main__":
+    env_vars = load_environment(ENVIRONMENT_FILE_PATH)
+
+    parser = argparse.ArgumentParser(description="Run a worker for a distributed simulation.")
+    parser.add_argument("--host", default=env_vars["COORDINATOR_HOST"], help="Coordinator host")
+    parser.add_argument("--port", type=int, default=env_vars["COORDINATOR_PORT"], help="Coordinator port")
+    args = parser.parse_args()
+
+    W = Worker(args.host, args.port, timeout=env_vars["WORKER_TIMEOUT_SECONDS"])
+    W.run()
@@ -0,0 +1,447 @@
+import heapq
+import pickle
+import time
+
+import networkx as nx
+import numpy
+
+# float("inf") is a function call, which adds up on every edge a search relaxes
+INFINITY = float("inf")
+
+
+class ContractionHierarchy:
+    """
+    Contraction hierarchy over a street graph for fast point to point routing.
+
+    Preprocessing contracts nodes one at a time from least to most important, adding a shortcut edge
+    whenever removing a node would lengthen a shortest path between its neighbours. Contraction stops once
+    core_size nodes remain. Late contractions are the slowest and add the most shortcuts, so instead the
+    distances between every pair of core nodes are computed up front into a table.
+
+    A query climbs from the origin and the destination towards more important nodes until it reaches the core,
+    which settles around a hundred nodes, then looks up the best pair of core entry points in the table.
+    Node IDs are mapped to indices so the search works on lists instead of dictionaries keyed by OSM IDs.
+    Shortcuts are unpacked into the original nodes.
+    """
+
+    # OSMNX node of each index, and the reverse lookup
+    nodes = None
+    node_index = None
+    # index -> ((more important index, weight), ...) for edges leaving the node. Searched forward from the origin.
+    upward_graph = None
+    # index -> ((more important index, weight), ...) for edges entering the node. Searched backward from the destination.
+    downward_graph = None
+    # (from index, to index) -> contracted index the shortcut skips
+    shortcut_middle = None
+
+    # Index -> row of the core tables, and the index of each row
+    core_index = None
+    core_nodes = None
+    # Shortest distance between core nodes, and the next core row along that path. Float64 and Int32, core_size squared.
+    core_dist = None
+    core_next = None
+
+    def __init__(self):
+        self.nodes = []
+        self.node_index = {}
+        self.upward_graph = []
+        self.downward_graph = []
+        self.shortcut_middle = {}
+
+        self.core_index = {}
+        self.core_nodes = numpy.zeros(0, dtype=numpy.int64)
+        self.core_dist = numpy.zeros((0, 0))
+        self.core_next = numpy.zeros((0, 0), dtype=numpy.int32)
+
+    def build(self, graph, weight="length", core_size=1500, witness_hop_limit=3, witness_settle_limit=60,
+              priority_hop_limit=2, priority_settle_limit=30):
+        """
+        Contract the graph down to its core and build the core distance table. Parallel edges keep their lowest weight
+        and self loops are dropped.
+        Graphs under ten times core_size keep a tenth of their nodes in the core.
+        :param graph: (NetworkX MultiDiGraph) Street graph
+        :param weight: (String) Edge attribute used as the edge weight
+        :param core_size: (Int) Most nodes left uncontracted. The table costs 12 bytes per pair, 27MB at 1500.
+        :param witness_hop_limit: (Int) Edges a witness search may follow when contracting before giving up and adding the shortcut
+        :param witness_settle_limit: (Int) Nodes a witness search may settle when contracting
+        :param priority_hop_limit: (Int) witness_hop_limit for the cheaper searches that estimate priorities
+        :param priority_settle_limit: (Int) witness_settle_limit for the cheaper searches that estimate priorities
+        :return: None (Hierarchy saved to memory)
+        """
+        start = time.time()
+
+        self.nodes = list(graph.nodes)
+        self.node_index = {node: index for index, node in enumerate(self.nodes)}
+        node_count = len(self.nodes)
+
+        out_edges = [{} for _ in range(node_count)]
+        in_edges = [{} for _ in range(node_count)]
+        for u, v, data in graph.edges(data=True):
+            if u == v:
+                continue
+
+            u = self.node_index[u]
+            v = self.node_index[v]
+            edge_weight = float(data.get(weight, 1))
+            if edge_weight < out_edges[u].get(v, INFINITY):
+                out_edges[u][v] = edge_weight
+                in_edges[v][u] = edge_weight
+
+        # Contracted neighbours spread contraction evenly. Depth keeps the hierarchy shallow, which keeps queries small.
+        contracted_neighbors = [0] * node_count
+        depths = [0] * node_count
+
+        def get_priority(node):
+            shortcuts = self._find_shortcuts(node, out_edges, in_edges, priority_hop_limit, priority_settle_limit)
+            edge_difference = len(shortcuts) - len(out_edges[node]) - len(in_edges[node])
+
+            return edge_difference + contracted_neighbors[node] + depths[node]
+
+        queue = [(get_priority(node), node) for node in range(node_count)]
+        heapq.heapify(queue)
+
+        self.upward_graph = [() for _ in range(node_count)]
+        self.downward_graph = [() for _ in range(node_count)]
+        self.shortcut_middle = {}
+
+        remaining = node_count
+        core_size = min(core_size, max(node_count // 10, 1))
+        while remaining > core_size:
+            _, node = heapq.heappop(queue)
+
+            # Lazy update. Contracting neighbours changes a node's priority, so recheck it before contracting.
+            priority = get_priority(node)
+            if queue and priority > queue[0][0]:
+                heapq.heappush(queue, (priority, node))
+                continue
+
+            shortcuts = self._find_shortcuts(node, out_edges, in_edges, witness_hop_limit, witness_settle_limit)
+
+            # Every remaining neighbour is contracted later or is in the core, so each remaining edge points up the hierarchy
+            self.upward_graph[node] = tuple(out_edges[node].items())
+            self.downward_graph[node] = tuple(in_edges[node].items())
+            out_edges[node] = None
+            in_edges[node] = None
+            remaining -= 1
+
+            neighbor_depth = depths[node] + 1
+            for u, _ in self.downward_graph[node]:
+                del out_edges[u][node]
+                contracted_neighbors[u] += 1
+                if depths[u] < neighbor_depth:
+                    depths[u] = neighbor_depth
+            for w, _ in self.upward_graph[node]:
+                del in_edges[w][node]
+                contracted_neighbors[w] += 1
+                if depths[w] < neighbor_depth:
+                    depths[w] = neighbor_depth
+
+            for u, w, shortcut_weight in shortcuts:
+                if shortcut_weight < out_edges[u].get(w, INFINITY):
+                    out_edges[u][w] = shortcut_weight
+                    in_edges[w][u] = shortcut_weight
+                    self.shortcut_middle[(u, w)] = node
+
+        contraction_time = time.time() - start
+
+        self._build_core_table([node for node in range(node_count) if out_edges[node] is not None], out_edges)
+
+        build_time = time.time() - start
+        print(f"Contraction Hierarchy Built in {build_time} seconds. {len(self.shortcut_middle)} shortcuts. "
+              f"Contraction {contraction_time} seconds, {len(self.core_nodes)} core nodes.")
+
+    def _build_core_table(self, core, out_edges):
+        """
+        All pairs shortest paths between core nodes over their remaining edges, with Floyd Warshall one row of the
+        table at a time in NumPy.
+        :param core: (List[Int]) Indices of the uncontracted nodes
+        :param out_edges: (List[Dictionary]) Remaining edges of the uncontracted nodes
+        :return: None (Tables saved to memory)
+        """
+        self.core_index = {node: row for row, node in enumerate(core)}
+        self.core_nodes = numpy.array(core, dtype=numpy.int64)
+
+        size = len(core)
+        core_dist = numpy.full((size, size), INFINITY)
+        core_next = numpy.full((size, size), -1, dtype=numpy.int32)
+        numpy.fill_diagonal(core_dist, 0)
+        numpy.fill_diagonal(core_next, numpy.arange(size, dtype=numpy.int32))
+
+        for row, node in enumerate(core):
+            for neighbor, edge_weight in out_edges[node].items():
+                core_dist[row, self.core_index[neighbor]] = edge_weight
+                core_next[row, self.core_index[neighbor]] = self.core_index[neighbor]
+
+        # Reused every step, allocating size squared arrays per step costs more than the arithmetic
+        via_middle = numpy.empty_like(core_dist)
+        shorter = numpy.empty(core_dist.shape, dtype=bool)
+        for middle in range(size):
+            numpy.add(core_dist[:, middle, None], core_dist[None, middle, :], out=via_middle)
+            numpy.less(via_middle, core_dist, out=shorter)
+            numpy.copyto(core_dist, via_middle, where=shorter)
+            numpy.copyto(core_next, core_next[:, middle, None], where=shorter)
+
+        self.core_dist = core_dist
+        self.core_next = core_next
+
+    def _find_shortcuts(self, node, out_edges, in_edges, hop_limit, settle_limit):
+        """
+        Shortcuts needed to keep shortest paths intact when the node is removed.
+        A shortcut u -> w is skipped when a witness path u -> w avoiding the node is no longer than going through it.
+        :return: (List[(Int, Int, Float)]) Shortcuts as (from index, to index, weight)
+        """
+        shortcuts = []
+
+        targets = out_edges[node]
+        if len(targets) == 0:
+            return shortcuts
+
+        for u, weight_in in in_edges[node].items():
+            max_weight_out = max((weight_out for w, weight_out in targets.items() if w != u), default=None)
+            if max_weight_out is None:
+                continue
+
+            witness_dist = self._witness_search(u, node, targets, weight_in + max_weight_out, out_edges, hop_limit, settle_limit)
+
+            for w, weight_out in targets.items():
+                if w == u:
+                    continue
+
+                via_node = weight_in + weight_out
+                if witness_dist.get(w, INFINITY) > via_node:
+                    shortcuts.append((u, w, via_node))
+
+        return shortcuts
+
+    def _witness_search(self, source, ignored_node, targets, max_cost, out_edges, hop_limit, settle_limit):
+        """
+        Dijkstra from source that never passes through the ignored node. Bounded by the longest path through the
+        ignored node, by hops and by settled nodes, and stops once every target is settled.
+        :return: (Dictionary) index -> best known distance from source
+        """
+        dist = {source: 0}
+        hops = {source: 0}
+        queue = [(0, source)]
+        unsettled_targets = len(targets)
+        settled = 0
+
+        while queue:
+            d, node = heapq.heappop(queue)
+            if d > dist[node]:
+                continue
+            if d > max_cost:
+                break
+
+            if node in targets:
+                unsettled_targets -= 1
+                if unsettled_targets == 0:
+                    break
+
+            settled += 1
+            if settled > settle_limit:
+                break
+
+            neighbor_hops = hops[node] + 1
+            if neighbor_hops > hop_limit:
+                continue
+
+            for neighbor, edge_weight in out_edges[node].items():
+                if neighbor == ignored_node:
+                    continue
+
+                new_dist = d + edge_weight
+                if new_dist < dist.get(neighbor, INFINITY):
+                    dist[neighbor] = new_dist
+                    hops[neighbor] = neighbor_hops
+                    heapq.heappush(queue, (new_dist, neighbor))
+
+        return dist
+
+    def shortest_path(self, origin, destination):
+        """
+        Shortest path between two nodes of the contracted graph.
+        :param origin: (OSMNX Node)
+        :param destination: (OSMNX Node)
+        :return: (List[OSMNX Node]) Route with origin and destination included. Same form as nx.shortest_path
+        """
+        if origin == destination:
+            return [origin]
+
+        forward_dist, forward_parent, forward_entries = self._upward_search(self.node_index[origin], self.upward_graph, self.downward_graph)
+        backward_dist, backward_parent, backward_entries = self._upward_search(self.node_index[destination], self.downward_graph, self.upward_graph)
+
+        best_dist = INFINITY
+        meeting_node = None
+        core_entries = None
+
+        # Both searches met below the core
+        smaller_dist, larger_dist = sorted([forward_dist, backward_dist], key=len)
+        for node, d in smaller_dist.items():
+            if node in larger_dist and node not in self.core_index and d + larger_dist[node] < best_dist:
+                best_dist = d + larger_dist[node]
+                meeting_node = node
+
+        # Or the route crosses the core. Every pair of entry points is one table lookup.
+        if len(forward_entries) > 0 and len(backward_entries) > 0:
+            forward_rows = [self.core_index[node] for node in forward_entries]
+            backward_rows = [self.core_index[node] for node in backward_entries]
+
+            entry_dist = (numpy.array([forward_dist[node] for node in forward_entries])[:, None]
+                          + self.core_dist[numpy.ix_(forward_rows, backward_rows)]
+                          + numpy.array([backward_dist[node] for node in backward_entries])[None, :])
+
+            forward_entry, backward_entry = divmod(int(numpy.argmin(entry_dist)), len(backward_entries))
+            if entry_dist[forward_entry, backward_entry] < best_dist:
+                best_dist = entry_dist[forward_entry, backward_entry]
+                core_entries = (forward_entries[forward_entry], backward_entries[backward_entry])
+
+        if best_dist == INFINITY:
+            raise nx.NetworkXNoPath(f"No path between {origin} and {destination}.")
+
+        if core_entries is None:
+            core_route = [meeting_node]
+        else:
+            core_route = self._get_core_route(core_entries[0], core_entries[1])
+
+        contracted_route = []
+        node = core_route[0]
+        while node is not None:
+            contracted_route.append(node)
+            node = forward_parent[node]
+        contracted_route.reverse()
+
+        contracted_route.extend(core_route[1:])
+
+        node = backward_parent[core_route[-1]]
+        while node is not None:
+            contracted_route.append(node)
+            node = backward_parent[node]
+
+        return [self.nodes[node] for node in self._unpack_route(contracted_route)]
+
+    def _upward_search(self, source, graph, reverse_graph):
+        """
+        Dijkstra towards more important nodes that stops at the core.
+        :param source: (Int) Index the search starts from
+        :param graph: (List) upward_graph to search forward, downward_graph to search backward
+        :param reverse_graph: (List) The other of the two, used for stalling
+        :return: (Dictionary, Dictionary, List[Int]) index -> distance, index -> parent index, core indices reached
+        """
+        dist = {source: 0}
+        parent = {source: None}
+        queue = [(0, source)]
+        core_entries = []
+        core_index = self.core_index
+
+        while queue:
+            d, node = heapq.heappop(queue)
+            if d > dist[node]:
+                continue
+
+            if node in core_index:
+                core_entries.append(node)
+                continue
+
+            # Stall on demand. Reaching the node from a more important one is shorter, so it can't be on the shortest path.
+            # Inlined, a method call per settled node is a noticeable part of a query.
+            stalled = False
+            for neighbor, edge_weight in reverse_graph[node]:
+                if dist.get(neighbor, INFINITY) + edge_weight < d:
+                    stalled = True
+                    break
+            if stalled:
+                continue
+
+            for neighbor, edge_weight in graph[node]:
+                new_dist = d + edge_weight
+                if new_dist < dist.get(neighbor, INFINITY):
+                    dist[neighbor] = new_dist
+                    parent[neighbor] = node
+                    heapq.heappush(queue, (new_dist, neighbor))
+
+        return dist, parent, core_entries
+
+    def _get_core_route(self, start, end):
+        """
+        Follow the core next hop table between two core nodes.
+        :param start: (Int) Core node index
+        :param end: (Int) Core node index
+        :return: (List[Int]) Indices from start to end. Edges may be shortcuts.
+        """
+        route = [start]
+
+        row = self.core_index[start]
+        end_row = self.core_index[end]
+        while row != end_row:
+            row = int(self.core_next[row, end_row])
+            route.append(int(self.core_nodes[row]))
+
+        return route
+
+    def _unpack_route(self, contracted_route):
+        """
+        Replace shortcuts in a route with the nodes they skip.
+        :param contracted_route: (List[Int]) Route that may contain shortcut edges
+        :return: (List[Int]) Route over original edges
+        """
+        route = [contracted_route[0]]
+
+        for index in range(0, len(contracted_route) - 1):
+            edges = [(contracted_route[index], contracted_route[index + 1])]
+            while edges:
+                u, w = edges.pop()
+                middle = self.shortcut_middle.get((u, w))
+                if middle is None:
+                    route.append(w)
+                else:
+                    # Last in first out, so push the second half first
+                    edges.append((middle, w))
+                    edges.append((u, middle))
+
+        return route
+
+    def save(self, path, fingerprint=None):
+        """
+        Persist the hierarchy, normally next to the cached graph it was built from.
+        :param path: (String) File path
+        :param fingerprint: (Dictionary) Identifies the graph and weight the hierarchy was built from. Checked by load.
+        :return:
+        """
+        with open(path, "wb") as hierarchy_file:
+            pickle.dump({
+                "fingerprint": fingerprint,
+                "nodes": self.nodes,
+                "upward_graph": self.upward_graph,
+                "downward_graph": self.downward_graph,
+                "shortcut_middle": self.shortcut_middle,
+                "core_nodes": self.core_nodes,
+                "core_dist": self.core_dist,
+                "core_next": self.core_next
+            }, hierarchy_file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path, fingerprint=None):
+        """
+        Load a hierarchy written by save.
+        :param path: (String) File path
+        :param fingerprint: (Dictionary) Fingerprint the hierarchy must have been saved with
+        :return: (ContractionHierarchy) None if it was saved for a different graph or weight, or in an older format
+        """
+        with open(path, "rb") as hierarchy_file:
+            data = pickle.load(hierarchy_file)
+
+        if data.get("fingerprint") != fingerprint:
+            return None
+
+        hierarchy = cls()
+        hierarchy.nodes = data["nodes"]
+        hierarchy.node_index = {node: index for index, node in enumerate(hierarchy.nodes)}
+        hierarchy.upward_graph = data["upward_graph"]
+        hierarchy.downward_graph = data["downward_graph"]
+        hierarchy.shortcut_middle = data["shortcut_middle"]
+        hierarchy.core_nodes = data["core_nodes"]
+        hierarchy.core_index = {int(node): row for row, node in enumerate(hierarchy.core_nodes)}
+        hierarchy.core_dist = data["core_dist"]
+        hierarchy.core_next = data["core_next"]
+
+        return hierarchy
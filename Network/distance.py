@@ -0,0 +1,66 @@
+import math
+
+import numpy
+
+EARTH_RADIUS_METERS = 6371008.8
+
+
+def haversine_meters(lat1, long1, lat2, long2):
+    """
+    Great circle distance between point pairs. Works on scalars or equal length arrays, one NumPy call for any number of pairs.
+    :param lat1: (Float or Array) Latitudes of the first points
+    :param long1: (Float or Array) Longitudes of the first points
+    :param lat2: (Float or Array) Latitudes of the second points
+    :param long2: (Float or Array) Longitudes of the second points
+    :return: (Float or Array) Distance in meters
+    """
+    lat1 = numpy.radians(lat1)
+    long1 = numpy.radians(long1)
+    lat2 = numpy.radians(lat2)
+    long2 = numpy.radians(long2)
+
+    half_chord = numpy.sin((lat2 - lat1) / 2) ** 2 + numpy.cos(lat1) * numpy.cos(lat2) * numpy.sin((long2 - long1) / 2) ** 2
+
+    return 2 * EARTH_RADIUS_METERS * numpy.arcsin(numpy.sqrt(numpy.clip(half_chord, 0, 1)))
+
+
+def haversine_point_meters(lat1, long1, lat2, long2):
+    """
+    Great circle distance between two points. Plain float math, several times faster than haversine_meters for a single pair.
+    :param lat1: (Float) Latitude of the first point
+    :param long1: (Float) Longitude of the first point
+    :param lat2: (Float) Latitude of the second point
+    :param long2: (Float) Longitude of the second point
+    :return: (Float) Distance in meters
+    """
+    lat1 = math.radians(lat1)
+    lat2 = math.radians(lat2)
+
+    half_chord = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(math.radians(long2 - long1) / 2) ** 2
+
+    return 2 * EARTH_RADIUS_METERS * math.asin(math.sqrt(min(max(half_chord, 0), 1)))
+
+
+def haversine_pairs_meters(cords1, cords2):
+    """
+    Distance between each pair of rows of two coordinate arrays.
+    :param cords1: (Array[N,2]) (lat, long) rows
+    :param cords2: (Array[N,2]) (lat, long) rows
+    :return: (Array[N]) Distance in meters
+    """
+    cords1 = numpy.asarray(cords1, dtype=float).reshape(-1, 2)
+    cords2 = numpy.asarray(cords2, dtype=float).reshape(-1, 2)
+
+    return haversine_meters(cords1[:, 0], cords1[:, 1], cords2[:, 0], cords2[:, 1])
+
+
+def haversine_one_to_many_meters(cord, cords):
+    """
+    Distance from one coordinate pair to every row of a coordinate array.
+    :param cord: (List[Float,Float]) (lat, long)
+    :param cords: (Array[N,2]) (lat, long) rows
+    :return: (Array[N]) Distance in meters
+    """
+    cords = numpy.asarray(cords, dtype=float)
+
+    return haversine_meters(cord[0], cord[1], cords[:, 0], cords[:, 1])
@@ -1,59 +1,206 @@
 import osmnx as ox
 import networkx as nx
+import numpy
+import hashlib
+import os
 import time
 
+from collections import OrderedDict
 from random import choice
+from rtree import index
+
+from Network import distance
+from Network.contraction_hierarchy import ContractionHierarchy
+
+# Radar travel mode -> OSMNX network type
+NETWORK_TYPES = {
+    "car": "drive",
+    "foot": "walk"
+}
+
+
+def get_graph_cache_path(env, network_type):
+    """
+    Cache file for a downloaded graph. The name is keyed on everything used to download it.
+    :param env: (Dictionary) Environment variables
+    :param network_type: (String) OSMNX network type
+    :return: (String) GraphML file path
+    """
+    lat = env["REGION_CENTRAL_COORD"][0]
+    long = env["REGION_CENTRAL_COORD"][1]
+    file_name = f"{network_type}_{lat:.6f}_{long:.6f}_{env['REGION_SIZE_METERS']}_{int(env['SIMPLIFY_STREET_GRAPH'])}.graphml"
+
+    return os.path.join(env["GRAPH_CACHE_DIRECTORY"], file_name)
+
+
+def get_hierarchy_cache_path(env, network_type):
+    """
+    Cache file for the contraction hierarchy of a cached graph, kept next to it.
+    :param env: (Dictionary) Environment variables
+    :param network_type: (String) OSMNX network type
+    :return: (String) Pickle file path
+    """
+    return get_graph_cache_path(env, network_type) + ".ch.pickle"
 
 
 class StreetGraph():
     graph = None
     ox_nodes_list = None
+    ox_node_cords = None
     ox_tower_node_list = []
+    tower_cords = None
+    tower_cord_list = []
+
+    travel_mode = None
+    network_type = None
 
     focal_point = None
     graph_size_in_meters = 0
 
     node_count = 0
 
+    contraction_hierarchy = None
+
+    route_cache = None
+    route_cache_size = 0
+    route_cache_hits = 0
+    route_cache_misses = 0
+
     geofence_ox_nodes = []
 
-    def __init__(self, env):
+    def __init__(self, env, travel_mode="car", tower_cords=None):
+        """
+        :param env: (Dictionary) Environment variables
+        :param travel_mode: (String) "car" or "foot". Picks the street network downloaded.
+        :param tower_cords: (Array[N,2]) Place towers at these coordinates instead of random nodes, so graphs for different travel modes share towers.
+        """
         self.raw_env_variables = env
 
+        if travel_mode.lower() not in NETWORK_TYPES:
+            raise ValueError("Travel Mode incorrect value")
+        self.travel_mode = travel_mode.lower()
+        self.network_type = NETWORK_TYPES[self.travel_mode]
+
         self.focal_point = self.raw_env_variables["REGION_CENTRAL_COORD"]
 
         self.graph_size_in_meters = self.raw_env_variables["REGION_SIZE_METERS"]
 
+        self.use_graph_cache = self.raw_env_variables["USE_GRAPH_CACHE"]
+        self.graph_cache_directory = self.raw_env_variables["GRAPH_CACHE_DIRECTORY"]
+
         self.generate_graph(self.raw_env_variables["SIMPLIFY_STREET_GRAPH"])
 
+        if self.raw_env_variables["USE_CONTRACTION_HIERARCHY"]:
+            self.generate_contraction_hierarchy()
+
         self.node_count = self.graph.number_of_nodes()
         self.geofence_ox_nodes = []
 
-        while len(self.ox_tower_node_list) < self.raw_env_variables["TOTAL_LOCATION_TOWERS"]:
-            ox_node = self.get_random_ox_node()
-            nx.set_node_attributes(self.graph, {ox_node: {"is_tower": True}})
-            self.ox_tower_node_list.append(ox_node)
+        self.route_cache = OrderedDict()
+        self.route_cache_size = self.raw_env_variables["ROUTE_CACHE_SIZE"]
+
+        # Spatial index over registered geofences. Points are stored as (long, lat) boxes.
+        self.geofence_index = index.Index()
+        self.geofence_cords = []
+        self.geofence_radii = []
+
+        self.ox_tower_node_list = []
+        if tower_cords is None:
+            while len(self.ox_tower_node_list) < self.raw_env_variables["TOTAL_LOCATION_TOWERS"]:
+                ox_node = self.get_random_ox_node()
+                nx.set_node_attributes(self.graph, {ox_node: {"is_tower": True}})
+                self.ox_tower_node_list.append(ox_node)
+
+            self.tower_cords = self.ox_node_cords[[self.ox_nodes_list.index(node) for node in self.ox_tower_node_list]]
+        else:
+            for tower_cord in tower_cords:
+                ox_node = self.get_nearest_ox_node_to_coordinate(tower_cord[0], tower_cord[1])
+                nx.set_node_attributes(self.graph, {ox_node: {"is_tower": True}})
+                self.ox_tower_node_list.append(ox_node)
+
+            self.tower_cords = numpy.array(tower_cords, dtype=float).reshape(-1, 2)
+
+        # Plain float pairs for per-position lookups, where NumPy call overhead outweighs the math on a few towers
+        self.tower_cord_list = [tuple(tower_cord) for tower_cord in self.tower_cords.tolist()]
 
         self.tower_distance_strength = self.raw_env_variables["LOCATION_TOWERS_RANGE_METERS"]
 
-    ### THE NETWORK IS SET TO DRIVE BUT WE ALLOW "FOOT" TRAVAL IN RADAR
     def generate_graph(self, simplify):
         """
         Download and generate the node graph with the osmnx library.
         Since this runs locally and is an intense part of the sim; the timing function is here to udnerstand if the size picked is to large.
+        When the graph cache is enabled the download is saved as GraphML and reused by later runs for the same region.
+        With DOWNLOAD_MISSING_GRAPH off a missing cache file is an error, since a fresh download may not match the graph others use.
         :return: None (Graph saved to memory)
         """
         start = time.time()
 
-        self.graph = ox.graph_from_point(self.focal_point, dist=self.graph_size_in_meters, network_type="drive",
-                                         simplify=simplify)
+        graph_cache_path = get_graph_cache_path(self.raw_env_variables, self.network_type)
+
+        if self.use_graph_cache and os.path.exists(graph_cache_path):
+            self.graph = ox.load_graphml(graph_cache_path)
+        elif not self.raw_env_variables["DOWNLOAD_MISSING_GRAPH"]:
+            raise FileNotFoundError(f"No cached {self.network_type} graph at {graph_cache_path} and DOWNLOAD_MISSING_GRAPH is off")
+        else:
+            self.graph = ox.graph_from_point(self.focal_point, dist=self.graph_size_in_meters, network_type=self.network_type,
+                                             simplify=simplify)
+            if self.use_graph_cache:
+                os.makedirs(self.graph_cache_directory, exist_ok=True)
+                ox.save_graphml(self.graph, graph_cache_path)
+
         nx.set_node_attributes(self.graph, False, "is_registered_geofence")
         nx.set_node_attributes(self.graph, False, "is_tower")
 
         self.ox_nodes_list = list(self.graph.nodes)
+        # (lat, long) rows in ox_nodes_list order for vectorized distance lookups
+        self.ox_node_cords = numpy.array([[self.graph.nodes[node]["y"], self.graph.nodes[node]["x"]] for node in self.ox_nodes_list], dtype=float)
 
         graph_gen_time = time.time() - start
-        print(f"Graph Generated in {graph_gen_time} seconds.")
+        print(f"{self.network_type.capitalize()} Graph Generated in {graph_gen_time} seconds.")
+
+    def generate_contraction_hierarchy(self):
+        """
+        Preprocess the graph into a ContractionHierarchy so routes are found in well under a millisecond.
+        The hierarchy is saved next to the cached graph and reused with it.
+        :return: None (Hierarchy saved to memory)
+        """
+        graph_cache_path = get_graph_cache_path(self.raw_env_variables, self.network_type)
+        hierarchy_cache_path = get_hierarchy_cache_path(self.raw_env_variables, self.network_type)
+        weight = "length"
+
+        self.contraction_hierarchy = None
+        if self.use_graph_cache and os.path.exists(hierarchy_cache_path):
+            fingerprint = self.get_graph_fingerprint(graph_cache_path, weight)
+            self.contraction_hierarchy = ContractionHierarchy.load(hierarchy_cache_path, fingerprint=fingerprint)
+            if self.contraction_hierarchy is None:
+                print("Cached Contraction Hierarchy does not match the graph. Rebuilding.")
+
+        if self.contraction_hierarchy is None:
+            self.contraction_hierarchy = ContractionHierarchy()
+            self.contraction_hierarchy.build(self.graph, weight=weight)
+            if self.use_graph_cache:
+                os.makedirs(self.graph_cache_directory, exist_ok=True)
+                self.contraction_hierarchy.save(hierarchy_cache_path, fingerprint=self.get_graph_fingerprint(graph_cache_path, weight))
+
+    def get_graph_fingerprint(self, graph_cache_path, weight):
+        """
+        Identify the graph a contraction hierarchy is built from, so a cached hierarchy is never used with another graph.
+        :param graph_cache_path: (String) GraphML file the graph was loaded from or saved to
+        :param weight: (String) Edge attribute used as the edge weight
+        :return: (Dictionary) Node and edge counts, SHA-256 of the GraphML file and the weight
+        """
+        graph_hash = hashlib.sha256()
+        if os.path.exists(graph_cache_path):
+            with open(graph_cache_path, "rb") as graph_file:
+                for chunk in iter(lambda: graph_file.read(1024 * 1024), b""):
+                    graph_hash.update(chunk)
+
+        return {
+            "nodes": self.graph.number_of_nodes(),
+            "edges": self.graph.number_of_edges(),
+            "graphml_sha256": graph_hash.hexdigest(),
+            "weight": weight
+        }
 
     def get_route(self, ox_origin_node, ox_destination_node):
         """
@@ -76,19 +223,44 @@ class StreetGraph():
 
     def get_node_route(self, ox_origin_node, ox_destination_node):
         """
-        Use NetworkX to find shortest route through node graph.
+        Find the shortest route by length through the node graph, with the contraction hierarchy when enabled or NetworkX otherwise.
+        Routes are kept in a least recently used cache of ROUTE_CACHE_SIZE routes shared by every Traveller on this graph.
         :param ox_origin_node: (OSMNX Node)
         :param ox_destination_node: (OSMNX Node)
-        :return:
+        :return: (Tuple[OSMNX Node]) Shared with the route cache and every Traveller on the same route
         """
-        return nx.shortest_path(self.graph, ox_origin_node, ox_destination_node)
+        route_key = (ox_origin_node, ox_destination_node)
+
+        if route_key in self.route_cache:
+            self.route_cache_hits += 1
+            self.route_cache.move_to_end(route_key)
+            return self.route_cache[route_key]
+
+        self.route_cache_misses += 1
+
+        if self.contraction_hierarchy is not None:
+            node_route = self.contraction_hierarchy.shortest_path(ox_origin_node, ox_destination_node)
+        else:
+            node_route = nx.shortest_path(self.graph, ox_origin_node, ox_destination_node, weight="length")
 
-    def add_geofences_by_coords(self, coord, is_trip_destination=False, description="None"):
+        node_route = tuple(node_route)
+
+        if self.route_cache_size > 0:
+            self.route_cache[route_key] = node_route
+            if len(self.route_cache) > self.route_cache_size:
+                self.route_cache.popitem(last=False)
+
+        return node_route
+
+    def add_geofences_by_coords(self, coord, is_trip_destination=False, description="None", radius=100, tag=None, external_id=None):
         """
         Register a geofence from Radar as a node in the OSMNX graph. Set the node attributes to house the geofence point.
         :param description:(String) description for debugging
         :param is_trip_destination: (Bool)  Is this node a node used for trips.
         :param coord: (List) Coordinate pair
+        :param radius: (Float) Geofence radius in meters
+        :param tag: (String) Radar geofence tag. Needed for trips.
+        :param external_id: (String) Radar geofence external ID. Needed for trips.
         :return: (Bool) Success
         """
         ox_nearest_node = self.get_nearest_ox_node_to_coordinate(coord[0], coord[1])
@@ -100,12 +272,19 @@ class StreetGraph():
                 "geofence_coordinates": coord,
                 "is_registered_geofence": True,
                 "is_trip_destination": is_trip_destination,
-                "description": description
+                "description": description,
+                "geofence_radius": radius,
+                "geofence_tag": tag,
+                "geofence_external_id": external_id
             }
 
             nx.set_node_attributes(self.graph, {ox_nearest_node : node_info})
             self.geofence_ox_nodes.append(ox_nearest_node)
 
+            self.geofence_index.insert(len(self.geofence_cords), (coord[1], coord[0], coord[1], coord[0]))
+            self.geofence_cords.append(coord)
+            self.geofence_radii.append(radius)
+
             return True
 
     def get_nearest_ox_node_to_coordinate(self, lat, long):
@@ -115,7 +294,31 @@ class StreetGraph():
         :param long: (Float) Longitude
         :return: (OSMNX Node)
         """
-        return ox.nearest_nodes(self.graph, long, lat)
+        meters_to_nodes = distance.haversine_one_to_many_meters((lat, long), self.ox_node_cords)
+
+        return self.ox_nodes_list[int(numpy.argmin(meters_to_nodes))]
+
+    def get_nearest_geofence(self, cord, candidates=4):
+        """
+        Find the registered geofence closest to a coordinate pair using the geofence spatial index.
+        The index works in degrees, so a few candidates are measured in meters to settle the nearest one.
+        :param cord: (List[Float,Float]) Coordinate pair
+        :param candidates: (Int) Number of index candidates to measure
+        :return: (Tuple(Float, Float)) Meters to the nearest geofence center and its radius. (inf, 0) without geofences.
+        """
+        nearest_meters = float("inf")
+        nearest_radius = 0
+
+        if len(self.geofence_cords) == 0:
+            return nearest_meters, nearest_radius
+
+        for geofence_id in self.geofence_index.nearest((cord[1], cord[0], cord[1], cord[0]), candidates):
+            meters_between = self.get_meters_between_points(cord, self.geofence_cords[geofence_id])
+            if meters_between < nearest_meters:
+                nearest_meters = meters_between
+                nearest_radius = self.geofence_radii[geofence_id]
+
+        return nearest_meters, nearest_radius
 
     def visualize(self):
         """
@@ -156,27 +359,24 @@ class StreetGraph():
         """
         return choice(self.geofence_ox_nodes)
 
-    def get_distance_between(self, point1, point2):
-        """
-        Get distance between two points
-        :param point1: (List[Float,Float]) coordinate pair
-        :param point2: (List[Float,Float]) coordinate pair
-        :return: Distance in euclidian units? Degrees?
-        """
-        return ox.distance.euclidean_dist_vec(point1[0], point1[1], point2[0], point2[1])
-
     def get_meters_between_points(self, point1, point2):
         """
-        Rough estimate of distance between two points on graph.
+        Great circle distance between two points on graph.
         :param point1: (List[Float,Float]) coordinate pair
         :param point2:  (List[Float,Float]) coordinate pair
         :return: (Float) distance in meters.
         """
-        miles_per_degree = 69.2
-        meters_per_mile = 1609.34
-        conversion = miles_per_degree * meters_per_mile
+        return distance.haversine_point_meters(point1[0], point1[1], point2[0], point2[1])
 
-        return conversion * self.get_distance_between(point1, point2)
+    def get_route_edge_meters(self, ox_node_route):
+        """
+        Length of every edge along a route in one vectorized call. Uses the geofence context like convert_ox_node_to_coordinate_pair.
+        :param ox_node_route: (Sequence[OSMNX Node]) Route with origin and destination included
+        :return: (Array[Float]) Meters for each edge, one shorter than the route
+        """
+        route_cords = [self.convert_ox_node_to_coordinate_pair(node) for node in ox_node_route]
+
+        return distance.haversine_pairs_meters(route_cords[:-1], route_cords[1:])
 
     def convert_ox_node_to_coordinate_pair(self, ox_node):
         """
@@ -200,6 +400,25 @@ class StreetGraph():
         else:
             return False
 
+    def is_ox_node_trip_destination(self, ox_node):
+        """
+        Utility function for checking if node is a registered geofence node used for trips.
+        :param ox_node: (OSMNX Node)
+        :return: (bool) Is node a trip destination node.
+        """
+        if self.is_ox_node_geofence(ox_node) and self.graph.nodes[ox_node]["is_trip_destination"]:
+            return True
+        else:
+            return False
+
+    def get_trip_destination_ids(self, ox_node):
+        """
+        Radar identifiers of a trip destination node's geofence.
+        :param ox_node: (OSMNX Node)
+        :return: (Tuple(String, String)) Geofence tag and external ID
+        """
+        return self.graph.nodes[ox_node]["geofence_tag"], self.graph.nodes[ox_node]["geofence_external_id"]
+
     def is_ox_node_tower(self, ox_node):
         """
         Utility function for checking if node is a tower node.
@@ -241,8 +460,7 @@ class StreetGraph():
         """
         shortest_distance = float("inf")
 
-        for ox_tower_node in self.ox_tower_node_list:
-            tower_cord = self.convert_ox_node_to_coordinate_pair(ox_tower_node)
+        for tower_cord in self.tower_cord_list:
             meters_between = self.get_meters_between_points(cord, tower_cord)
             if meters_between < shortest_distance:
                 shortest_distance = meters_between
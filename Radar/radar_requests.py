@@ -27,17 +27,21 @@ class RadarRequests:
 
         return response.json()
 
-    def _base_post_request(self, path, body={}):
+    def _base_post_request(self, path, body={}, session=None):
         """
         Makes a default POST request to the base Radar endpoint
         :param path: The path to make the request to off the base domain. Exclude leading foreslash
         :param body: JSON body to make with the get request
+        :param session: (requests.Session) Reuses the session's open connection. Defaults to a new connection per request.
         :return: Dictionary of json response
         """
         url = self.base_domain + path
         headers = {"Authorization": self.api_key}
 
-        response = requests.post(url, headers=headers, json=body)
+        if session is None:
+            session = requests
+
+        response = session.post(url, headers=headers, json=body)
 
         return response.json()
 
@@ -64,6 +68,44 @@ class RadarRequests:
         response = self._base_get_request(path=path, params=params)
         return response
 
+    def get_simulation_geofences(self, cord, radius, default_geofence_radius=100):
+        """
+        Retrieve nearby geofences and reduce them to what the simulation registers into a StreetGraph.
+        Plain dictionaries are returned so they can be shared with simulation workers as JSON.
+        :param cord: ([Float, Float]) Cordinate for centroid
+        :param radius: (Int) Radius from coordinate to perform search. In meters.
+        :param default_geofence_radius: (Float) Radius used for geofences without a geometryRadius. In meters.
+        :return: (List[Dictionary]) Geofences with 'coordinates', 'radius', 'is_trip_destination', 'description', 'tag' and 'external_id'
+        """
+        nearby_geofences = self.get_nearby_geofences(cord, radius=radius)["geofences"]
+
+        simulation_geofences = []
+        for geofence in nearby_geofences:
+            geofence_cord = geofence["geometryCenter"]["coordinates"]
+
+            # I THOUGHT IT WAS LAT LONG !! Need to swap I guess
+            updated_geofence_cord = [geofence_cord[1], geofence_cord[0]]
+
+            simulate_trip = False
+            if "metadata" in geofence:
+                if "trip_destination" in geofence["metadata"]:
+                    simulate_trip = geofence["metadata"]["trip_destination"]
+
+            geofence_radius = default_geofence_radius
+            if "geometryRadius" in geofence:
+                geofence_radius = geofence["geometryRadius"]
+
+            simulation_geofences.append({
+                "coordinates": updated_geofence_cord,
+                "radius": geofence_radius,
+                "is_trip_destination": simulate_trip,
+                "description": geofence["description"],
+                "tag": geofence.get("tag"),
+                "external_id": geofence.get("externalId")
+            })
+
+        return simulation_geofences
+
     def get_distance(self, origin, destination, travel_mode, units="metric"):
         """
         Calculate Travel Distance and Duration between origin and destination. Refer to Radar API Doc's
@@ -102,15 +144,16 @@ class RadarRequests:
         response = self._base_get_request(path=path, params=params)
         return response
 
-    def track(self, device_data, accuracy=10, stopped=False, body={}):
+    def get_track_body(self, device_data, accuracy=10, stopped=False, body=None):
         """
-        Submit a location update for a track event in Radar.
+        Build the body of a track request.
         :param device_data: (Dictionary) Must contain ~ 'device_id' (str), 'user_id' (str), 'position' (coordinate pair).
         :param accuracy: (Int) Location update accuracy. Defaults to 10
         :param body: (Dictionary) Additional Track Data
-        :return: Dictionary of track response. Refer to Radar API Documentation
+        :return: (Dictionary) Track body
         """
-        path = "track"
+        if body is None:
+            body = {}
 
         body["deviceId"] = str(device_data["deviceId"])
         body["userId"] = str(device_data["userId"])
@@ -119,12 +162,31 @@ class RadarRequests:
         body["accuracy"] = accuracy
         body["stopped"] = stopped
 
-        response = self._base_post_request(path=path, body=body)
+        return body
+
+    def post_track_body(self, body, session=None):
+        """
+        Submit an already built track body.
+        :param body: (Dictionary) Refer to get_track_body
+        :param session: (requests.Session) Refer to _base_post_request
+        :return: Dictionary of track response. Refer to Radar API Documentation
+        """
+        return self._base_post_request(path="track", body=body, session=session)
+
+    def track(self, device_data, accuracy=10, stopped=False, body=None):
+        """
+        Submit a location update for a track event in Radar.
+        :param device_data: (Dictionary) Must contain ~ 'device_id' (str), 'user_id' (str), 'position' (coordinate pair).
+        :param accuracy: (Int) Location update accuracy. Defaults to 10
+        :param body: (Dictionary) Additional Track Data
+        :return: Dictionary of track response. Refer to Radar API Documentation
+        """
+        response = self.post_track_body(self.get_track_body(device_data, accuracy=accuracy, stopped=stopped, body=body))
         return response
 
-    def trip_update(self, trip_status, device_data, destination_geofence_tag, destination_geofence_id, travel_mode, trip_id=None):
+    def get_trip_update_body(self, trip_status, device_data, destination_geofence_tag, destination_geofence_id, travel_mode, trip_id=None):
         """
-        Start / Complete a trip. Results in 1 track call being made.
+        Build the track body that starts / completes a trip.
 
         :param trip_status: (str) either "started" or "completed"
         :param device_data: (Dictionary) Must contain ~ 'device_id' (str), 'user_id' (str), 'position' (coordinate pair).
@@ -132,7 +194,7 @@ class RadarRequests:
         :param destination_geofence_id: (str) The id for the destination geofence in Radar.
         :param travel_mode: (str) either "car" or "foot"
         :param trip_id: (str) Random value to be used for trip ID.
-        :return: Dictionary of trip data. Refer to Radar API Documentation.
+        :return: (Dictionary) Track body
         """
         if trip_status not in ["started", "completed"]:
             raise ValueError("Trip Status is incorrect Value")
@@ -140,8 +202,6 @@ class RadarRequests:
         if travel_mode not in ["car", "foot"]:
             raise ValueError("Travel Mode incorrect value")
 
-        path = "track"
-
         body = {
             "tripOptions": {
                 "externalId": trip_id,
@@ -152,5 +212,22 @@ class RadarRequests:
             }
         }
 
-        response = self.track(device_data, body=body)
+        return self.get_track_body(device_data, body=body)
+
+    def trip_update(self, trip_status, device_data, destination_geofence_tag, destination_geofence_id, travel_mode, trip_id=None):
+        """
+        Start / Complete a trip. Results in 1 track call being made.
+
+        :param trip_status: (str) either "started" or "completed"
+        :param device_data: (Dictionary) Must contain ~ 'device_id' (str), 'user_id' (str), 'position' (coordinate pair).
+        :param destination_geofence_tag: (str) The tag for the destination geofence in Radar.
+        :param destination_geofence_id: (str) The id for the destination geofence in Radar.
+        :param travel_mode: (str) either "car" or "foot"
+        :param trip_id: (str) Random value to be used for trip ID.
+        :return: Dictionary of trip data. Refer to Radar API Documentation.
+        """
+        body = self.get_trip_update_body(trip_status, device_data, destination_geofence_tag, destination_geofence_id,
+                                         travel_mode, trip_id=trip_id)
+
+        response = self.post_track_body(body)
         return {"response": response, "trip_id": trip_id}
@@ -0,0 +1,218 @@
+from Radar.radar_requests import RadarRequests
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+class RadarRequestDispatcher:
+    """
+    Non-blocking stand in for the track and trip_update calls of RadarRequests.
+    Calls are queued by the simulation loop and sent in batches by background threads, so a slow response never holds up the loop.
+    Devices are pinned to one shard with a single sending thread, which keeps each device's track and trip calls in order.
+    Each shard keeps one requests.Session, so its thread reuses an open connection instead of a new TCP / TLS handshake per call.
+    A shard holds at most REQUEST_QUEUE_LIMIT unsent calls. Past that new track calls are dropped and counted rather than
+    queued without bound behind a server that can't keep up. Trip calls are never dropped, a trip missing its start or
+    its completion is broken on the Radar side.
+    Error responses such as 429 count as failed, not sent.
+    """
+
+    batch_size = 0
+    shard_count = 0
+    queue_limit = 0
+    late_seconds = 0
+
+    requests_queued = 0
+    requests_sent = 0
+    requests_failed = 0
+    requests_dropped = 0
+    requests_late = 0
+    max_request_delay = 0
+
+    trips_started = 0
+    trips_completed = 0
+
+    def __init__(self, radar_requests: RadarRequests, env):
+        self.radar_requests = radar_requests
+
+        self.batch_size = env["REQUEST_BATCH_SIZE"]
+        self.shard_count = env["REQUEST_SHARDS"]
+        self.queue_limit = env["REQUEST_QUEUE_LIMIT"]
+        self.late_seconds = env["REQUEST_LATE_SECONDS"]
+
+        self.shard_queues = [[] for _ in range(0, self.shard_count)]
+        self.shard_executors = [ThreadPoolExecutor(max_workers=1) for _ in range(0, self.shard_count)]
+        # Only used by the shard's own sending thread
+        self.shard_sessions = [self.create_session() for _ in range(0, self.shard_count)]
+        # Queued plus handed to the sending thread, not yet sent
+        self.shard_pending = [0] * self.shard_count
+
+        # Sending threads update the sent / failed counts and the pending counts
+        self.lock = threading.Lock()
+
+        self.requests_queued = 0
+        self.requests_sent = 0
+        self.requests_failed = 0
+        self.requests_dropped = 0
+        self.requests_late = 0
+        self.max_request_delay = 0
+
+        self.trips_started = 0
+        self.trips_completed = 0
+
+    def create_session(self):
+        """
+        Session for a shard's sending thread. Raises on 4xx / 5xx responses, so they are counted as failures.
+        :return: (requests.Session)
+        """
+        session = requests.Session()
+        session.hooks["response"].append(lambda response, *args, **kwargs: response.raise_for_status())
+
+        return session
+
+    def track(self, device_data, accuracy=10, stopped=False, body=None):
+        """
+        Queue a track call. Same arguments as RadarRequests.track
+        :return: None. Responses are not kept.
+        """
+        track_body = self.radar_requests.get_track_body(device_data, accuracy=accuracy, stopped=stopped, body=body)
+        self.queue_track_body(track_body)
+
+    def trip_update(self, trip_status, device_data, destination_geofence_tag, destination_geofence_id, travel_mode, trip_id=None):
+        """
+        Queue a trip start / complete. Same arguments as RadarRequests.trip_update
+        :return: Dictionary with the trip ID. The response is not kept.
+        """
+        trip_body = self.radar_requests.get_trip_update_body(trip_status, device_data, destination_geofence_tag,
+                                                             destination_geofence_id, travel_mode, trip_id=trip_id)
+        if self.queue_track_body(trip_body, droppable=False):
+            if trip_status == "started":
+                self.trips_started += 1
+            else:
+                self.trips_completed += 1
+
+        return {"response": None, "trip_id": trip_id}
+
+    def queue_track_body(self, body, droppable=True):
+        """
+        Queue a track body on its device's shard, sending the shard's batch once it is full.
+        A droppable body is dropped when the shard already holds REQUEST_QUEUE_LIMIT unsent bodies.
+        :param body: (Dictionary) Refer to RadarRequests.get_track_body
+        :param droppable: (Bool) False for bodies that must be sent, like trip starts and completions
+        :return: (Bool) Body was queued
+        """
+        shard = hash(body["deviceId"]) % self.shard_count
+
+        with self.lock:
+            if droppable and self.shard_pending[shard] >= self.queue_limit:
+                self.requests_dropped += 1
+                return False
+            self.shard_pending[shard] += 1
+
+        # Wall time, not the simulation clock. Lateness is about the network keeping up.
+        self.shard_queues[shard].append((time.monotonic(), body))
+        self.requests_queued += 1
+
+        if len(self.shard_queues[shard]) >= self.batch_size:
+            self.flush_shard(shard)
+
+        return True
+
+    def flush(self):
+        """
+        Send every queued batch. Called once per simulation tick.
+        :return:
+        """
+        for shard in range(0, self.shard_count):
+            if len(self.shard_queues[shard]) > 0:
+                self.flush_shard(shard)
+
+    def flush_shard(self, shard):
+        """
+        Hand a shard's queued bodies to its sending thread.
+        :param shard: (Int)
+        :return:
+        """
+        batch = self.shard_queues[shard]
+        self.shard_queues[shard] = []
+
+        self.shard_executors[shard].submit(self.send_batch, shard, batch)
+
+    def send_batch(self, shard, batch):
+        """
+        Send a batch of track bodies in order. Runs on a shard's sending thread.
+        :param shard: (Int)
+        :param batch: (List[(Float, Dictionary)]) Monotonic time each body was queued, and the track body
+        :return:
+        """
+        sent = 0
+        late = 0
+        max_delay = 0
+        try:
+            for queued_time, body in batch:
+                delay = time.monotonic() - queued_time
+                if delay > self.late_seconds:
+                    late += 1
+                max_delay = max(max_delay, delay)
+
+                try:
+                    self.radar_requests.post_track_body(body, session=self.shard_sessions[shard])
+                    sent += 1
+                except (requests.RequestException, ValueError):
+                    pass
+        finally:
+            # Anything not sent failed, including the rest of the batch after an unexpected error.
+            # The shard's capacity is always released, or it would drop every later request for its devices.
+            with self.lock:
+                self.requests_sent += sent
+                self.requests_failed += len(batch) - sent
+                self.requests_late += late
+                self.max_request_delay = max(self.max_request_delay, max_delay)
+                self.shard_pending[shard] -= len(batch)
+
+    def shutdown(self):
+        """
+        Send everything still queued and wait for the sending threads to finish.
+        :return:
+        """
+        self.flush()
+
+        for executor in self.shard_executors:
+            executor.shutdown(wait=True)
+
+        for session in self.shard_sessions:
+            session.close()
+
+    def get_report(self):
+        """
+        Request and trip totals. Backlog is queued requests not sent yet.
+        Late requests waited over REQUEST_LATE_SECONDS between being queued and being sent.
+        :return: (Dictionary) Report
+        """
+        with self.lock:
+            return {
+                "requests_queued": self.requests_queued,
+                "requests_sent": self.requests_sent,
+                "requests_failed": self.requests_failed,
+                "requests_dropped": self.requests_dropped,
+                "requests_late": self.requests_late,
+                "max_request_delay_seconds": self.max_request_delay,
+                "request_backlog": self.requests_queued - self.requests_sent - self.requests_failed,
+                "trips_started": self.trips_started,
+                "trips_completed": self.trips_completed
+            }
+
+    def print_report(self):
+        """
+        Print the request report.
+        :return:
+        """
+        report = self.get_report()
+
+        print(f"Requests Sent: {report['requests_sent']} / {report['requests_queued']} ({report['requests_failed']} failed)")
+        print(f"Requests Dropped: {report['requests_dropped']} at the queue limit of {self.queue_limit} per shard")
+        print(f"Requests Late: {report['requests_late']} queued over {self.late_seconds} seconds "
+              f"(Max delay {report['max_request_delay_seconds']:.2f} seconds)")
+        print(f"Trips Started: {report['trips_started']} Completed: {report['trips_completed']}")
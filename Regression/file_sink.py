@@ -0,0 +1,73 @@
+from Radar.radar_requests import RadarRequests
+
+import copy
+import json
+import threading
+
+
+def round_floats(value, digits=7):
+    """
+    Round every float in a JSON like value, so event streams compare equal across platforms.
+    :param value: (Any) Dictionary, list or scalar
+    :param digits: (Int) Decimal places kept
+    :return: (Any) Rounded copy
+    """
+    if isinstance(value, float):
+        return round(value, digits)
+    elif isinstance(value, dict):
+        return {key: round_floats(item, digits) for key, item in value.items()}
+    elif isinstance(value, (list, tuple)):
+        return [round_floats(item, digits) for item in value]
+
+    return value
+
+
+class FileRequestSink(RadarRequests):
+    """
+    RadarRequests that records every track body instead of sending it, and serves a fixed set of geofences.
+    Lets a scenario run fully offline and leaves an event stream to compare against golden output.
+    """
+
+    def __init__(self, env, geofences):
+        super().__init__(env)
+
+        self.geofences = geofences
+        self.events = []
+
+        # The request dispatcher posts from its shard threads
+        self.lock = threading.Lock()
+
+    def _base_get_request(self, path, params=None):
+        raise RuntimeError(f"FileRequestSink can't serve GET {path}")
+
+    def _base_post_request(self, path, body=None, session=None):
+        with self.lock:
+            self.events.append({"path": path, "body": body})
+
+        return {}
+
+    def get_simulation_geofences(self, cord, radius, default_geofence_radius=100):
+        return copy.deepcopy(self.geofences)
+
+    def get_event_stream(self):
+        """
+        Recorded events in a deterministic order. Shard threads interleave devices differently from run to run,
+        but each device's events are always in order, so events are grouped by device keeping that order.
+        :return: (List[Dictionary]) Events
+        """
+        with self.lock:
+            events = list(self.events)
+
+        events.sort(key=lambda event: event["body"]["deviceId"])
+
+        return round_floats(events)
+
+    def write(self, path):
+        """
+        Write the event stream as JSON lines.
+        :param path: (String) File path
+        :return:
+        """
+        with open(path, "w") as event_file:
+            for event in self.get_event_stream():
+                event_file.write(json.dumps(event, sort_keys=True) + "\n")
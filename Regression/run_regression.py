@@ -0,0 +1,267 @@
+from Regression.file_sink import FileRequestSink
+from Regression.scenarios import BASE_ENV, SCENARIOS
+from Regression.synthetic_graph import write_synthetic_graph_cache
+from clock import VirtualClock
+from simulator import Simulator
+
+import argparse
+import contextlib
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+REGRESSION_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+GOLDEN_DIRECTORY = os.path.join(REGRESSION_DIRECTORY, "golden")
+BASELINES_FILE_PATH = os.path.join(REGRESSION_DIRECTORY, "baselines.json")
+
+# Allowed drift from the stored baselines, relative to the baseline value
+DEFAULT_TOLERANCES = {
+    "throughput": 0.30,
+    "tick_latency_p95_ms": 0.50,
+    "peak_memory_bytes": 0.15
+}
+
+# Timed runs per scenario. The fastest is kept, since noise on a shared machine only ever slows a run down.
+TIMED_RUNS = 3
+
+
+def run_scenario(scenario, trace_memory=False):
+    """
+    Run a scenario from scratch on a synthetic graph with a virtual clock, recording requests to a file sink.
+    Drives Simulator.run, so the loop, termination and finish are the same code a normal run uses.
+    :param scenario: (Dictionary) Refer to Regression/scenarios.py
+    :param trace_memory: (Bool) Trace allocations for peak memory. Slows the run, so timings are only kept without it.
+    :return: (List[Dictionary], Dictionary) Event stream and run metrics
+    """
+    env = dict(BASE_ENV)
+    env.update(scenario["env"])
+
+    with tempfile.TemporaryDirectory() as cache_directory:
+        env["GRAPH_CACHE_DIRECTORY"] = cache_directory
+        write_synthetic_graph_cache(env, scenario["graph"])
+
+        random.seed(scenario["seed"])
+        clock = VirtualClock()
+        sink = FileRequestSink(env, scenario["geofences"])
+
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            if trace_memory:
+                tracemalloc.start()
+
+            simulator = Simulator(env_vars=env, run_id="regression", radar_requests=sink, clock=clock)
+
+            # Time each tick of the real run loop. Simulator.run calls update_travellers through the instance.
+            tick_durations = []
+            update_travellers = simulator.update_travellers
+
+            def timed_update_travellers():
+                tick_start = time.perf_counter()
+                update_travellers()
+                tick_durations.append(time.perf_counter() - tick_start)
+
+            simulator.update_travellers = timed_update_travellers
+
+            start = time.perf_counter()
+            simulator.run()
+            run_time = time.perf_counter() - start
+
+            peak_memory = 0
+            if trace_memory:
+                peak_memory = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+
+    tick_durations.sort()
+    metrics = {
+        "events": len(sink.events),
+        "throughput": len(simulator.traveller_list) * len(tick_durations) / run_time,
+        "tick_latency_p50_ms": 1000 * statistics.median(tick_durations),
+        "tick_latency_p95_ms": 1000 * tick_durations[int(0.95 * (len(tick_durations) - 1))],
+        "peak_memory_bytes": peak_memory
+    }
+
+    return sink.get_event_stream(), metrics
+
+
+def load_golden_events(name):
+    """
+    :param name: (String) Scenario name
+    :return: (List[Dictionary]) Golden event stream. None if the scenario has none yet.
+    """
+    path = os.path.join(GOLDEN_DIRECTORY, f"{name}.jsonl")
+    if not os.path.exists(path):
+        return None
+
+    with open(path) as golden_file:
+        return [json.loads(line) for line in golden_file]
+
+
+def write_golden_events(name, events):
+    """
+    :param name: (String) Scenario name
+    :param events: (List[Dictionary]) Event stream
+    :return:
+    """
+    os.makedirs(GOLDEN_DIRECTORY, exist_ok=True)
+
+    with open(os.path.join(GOLDEN_DIRECTORY, f"{name}.jsonl"), "w") as golden_file:
+        for event in events:
+            golden_file.write(json.dumps(event, sort_keys=True) + "\n")
+
+
+def compare_events(events, golden_events):
+    """
+    :param events: (List[Dictionary]) Event stream from this run
+    :param golden_events: (List[Dictionary]) Golden event stream
+    :return: (List[String]) Failures
+    """
+    if events == golden_events:
+        return []
+
+    failures = [f"event stream has {len(events)} events, golden has {len(golden_events)}"]
+    for index, (event, golden_event) in enumerate(zip(events, golden_events)):
+        if event != golden_event:
+            failures.append(f"first differing event #{index}: {json.dumps(event, sort_keys=True)} != {json.dumps(golden_event, sort_keys=True)}")
+            break
+
+    return failures
+
+
+def compare_metrics(metrics, baseline, tolerances):
+    """
+    :param metrics: (Dictionary) Metrics from this run
+    :param baseline: (Dictionary) Stored baseline metrics
+    :param tolerances: (Dictionary) Allowed relative drift per metric
+    :return: (List[String]) Failures
+    """
+    failures = []
+
+    minimum_throughput = baseline["throughput"] * (1 - tolerances["throughput"])
+    if metrics["throughput"] < minimum_throughput:
+        failures.append(f"throughput {metrics['throughput']:.0f} updates/s below {minimum_throughput:.0f} (baseline {baseline['throughput']:.0f})")
+
+    maximum_latency = baseline["tick_latency_p95_ms"] * (1 + tolerances["tick_latency_p95_ms"])
+    if metrics["tick_latency_p95_ms"] > maximum_latency:
+        failures.append(f"p95 tick latency {metrics['tick_latency_p95_ms']:.3f}ms above {maximum_latency:.3f}ms (baseline {baseline['tick_latency_p95_ms']:.3f}ms)")
+
+    maximum_memory = baseline["peak_memory_bytes"] * (1 + tolerances["peak_memory_bytes"])
+    if metrics["peak_memory_bytes"] > maximum_memory:
+        failures.append(f"peak memory {metrics['peak_memory_bytes']} bytes above {maximum_memory:.0f} (baseline {baseline['peak_memory_bytes']})")
+
+    return failures
+
+
+def find_stale_metrics(metrics, baseline, tolerances):
+    """
+    Metrics that beat their baseline by more than the tolerance. The baseline then no longer guards against a regression
+    back to the old numbers, so it should be re-recorded with --update.
+    :param metrics: (Dictionary) Metrics from this run
+    :param baseline: (Dictionary) Stored baseline metrics
+    :param tolerances: (Dictionary) Allowed relative drift per metric
+    :return: (List[String]) Warnings
+    """
+    warnings = []
+
+    maximum_throughput = baseline["throughput"] * (1 + tolerances["throughput"])
+    if metrics["throughput"] > maximum_throughput:
+        warnings.append(f"throughput {metrics['throughput']:.0f} updates/s above {maximum_throughput:.0f} (baseline {baseline['throughput']:.0f})")
+
+    minimum_latency = baseline["tick_latency_p95_ms"] * (1 - tolerances["tick_latency_p95_ms"])
+    if metrics["tick_latency_p95_ms"] < minimum_latency:
+        warnings.append(f"p95 tick latency {metrics['tick_latency_p95_ms']:.3f}ms below {minimum_latency:.3f}ms (baseline {baseline['tick_latency_p95_ms']:.3f}ms)")
+
+    minimum_memory = baseline["peak_memory_bytes"] * (1 - tolerances["peak_memory_bytes"])
+    if metrics["peak_memory_bytes"] < minimum_memory:
+        warnings.append(f"peak memory {metrics['peak_memory_bytes']} bytes below {minimum_memory:.0f} (baseline {baseline['peak_memory_bytes']})")
+
+    return warnings
+
+
+def run_regression(scenario_names=None, update=False):
+    """
+    Replay each scenario TIMED_RUNS times keeping the fastest, and once tracing memory, then compare against golden output and baselines.
+    Every run must produce the same events, otherwise the scenario is not deterministic and nothing else can be trusted.
+    Metrics that beat their baseline by more than the tolerance are reported as a stale baseline without failing.
+    :param scenario_names: (List[String]) Scenarios to run. Defaults to all.
+    :param update: (Bool) Store this run as the new golden output and baselines instead of comparing.
+    :return: (Bool) Passed
+    """
+    baselines = {"tolerances": DEFAULT_TOLERANCES, "scenarios": {}}
+    if os.path.exists(BASELINES_FILE_PATH):
+        with open(BASELINES_FILE_PATH) as baselines_file:
+            baselines = json.load(baselines_file)
+
+    passed = True
+    for scenario in SCENARIOS:
+        if scenario_names and scenario["name"] not in scenario_names:
+            continue
+
+        deterministic = True
+        events, metrics = run_scenario(scenario)
+        for _ in range(1, TIMED_RUNS):
+            timed_events, timed_metrics = run_scenario(scenario)
+            deterministic = deterministic and timed_events == events
+            if timed_metrics["throughput"] > metrics["throughput"]:
+                metrics = timed_metrics
+
+        traced_events, traced_metrics = run_scenario(scenario, trace_memory=True)
+        deterministic = deterministic and traced_events == events
+        metrics["peak_memory_bytes"] = traced_metrics["peak_memory_bytes"]
+
+        print(f"{scenario['name']}: {metrics['events']} events, {metrics['throughput']:.0f} updates/s, "
+              f"p50 {metrics['tick_latency_p50_ms']:.3f}ms p95 {metrics['tick_latency_p95_ms']:.3f}ms, "
+              f"peak {metrics['peak_memory_bytes'] / 1024 / 1024:.1f}MiB")
+
+        failures = []
+        if not deterministic:
+            failures.append("scenario is not deterministic, runs produced different events")
+
+        if update and len(failures) == 0:
+            write_golden_events(scenario["name"], events)
+            baselines["scenarios"][scenario["name"]] = metrics
+            print("\tUpdated golden events and baseline.")
+            continue
+
+        golden_events = load_golden_events(scenario["name"])
+        if golden_events is None:
+            failures.append("no golden events, run with --update to create them")
+        else:
+            failures.extend(compare_events(events, golden_events))
+
+        warnings = []
+        if scenario["name"] not in baselines["scenarios"]:
+            failures.append("no baseline, run with --update to create it")
+        else:
+            failures.extend(compare_metrics(metrics, baselines["scenarios"][scenario["name"]], baselines["tolerances"]))
+            warnings.extend(find_stale_metrics(metrics, baselines["scenarios"][scenario["name"]], baselines["tolerances"]))
+
+        # Timings are too noisy to fail on, but a baseline that is beaten by a wide margin hides regressions
+        for warning in warnings:
+            print(f"\tSTALE BASELINE: {warning}, run with --update to re-record it")
+        for failure in failures:
+            print(f"\tFAILED: {failure}")
+        if len(failures) > 0:
+            passed = False
+
+    if update:
+        with open(BASELINES_FILE_PATH, "w") as baselines_file:
+            json.dump(baselines, baselines_file, indent=2)
+
+    return passed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay seeded scenarios and fail on behavior or performance drift.")
+    parser.add_argument("--scenario", action="append", help="Scenario to run. Repeat for several. Defaults to all.")
+    parser.add_argument("--update", action="store_true", help="Store this run as the new golden output and baselines.")
+    args = parser.parse_args()
+
+    if not run_regression(args.scenario, update=args.update):
+        print("REGRESSION FAILED")
+        sys.exit(1)
+
+    print("Regression passed.")
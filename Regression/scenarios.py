@@ -0,0 +1,108 @@
+# Every scenario starts from this complete environment rather than Environment.json,
+# so editing the local environment never changes golden output.
+BASE_ENV = {
+    "TEST_CLIENT_KEY": "",
+    "REGION_SIZE_METERS": 1500,
+    "REGION_CENTRAL_COORD": [33.19066141960032, -117.37769726328379],
+    "TOTAL_SIM_USERS": 40,
+    "TRAVEL_MODE": ["car"],
+    "TRAVEL_MODE_SHARES": [1],
+    "CAR_TRAVEL_SPEED_METERS_PER_SECOND": 20.12,
+    "FOOT_TRAVEL_SPEED_METERS_PER_SECOND": 1.78,
+    "MIN_SLEEP_TIME_SECONDS": 10,
+    "MAX_SLEEP_TIME_SECONDS": 60,
+    "MIN_DWELL_TIME_SECONDS": 10,
+    "MAX_DWELL_TIME_SECONDS": 60,
+    "CHANCE_TO_TRAVEL_TO_GEOFENCE": 0.5,
+    "CHANCE_TO_TRAVEL_TO_MULTIPLE_NODES": 0.5,
+    "AVERAGE_LOCATION_ACCURACY": 10,
+    "TOTAL_LOCATION_TOWERS": 3,
+    "LOCATION_TOWERS_RANGE_METERS": 1000,
+    "USER_ID_PREFIX": "SIM_",
+    "DEVICE_ID_PREFIX": "SIM_DEVICE_",
+    "SIMPLIFY_STREET_GRAPH": False,
+    "USE_GRAPH_CACHE": True,
+    "GRAPH_CACHE_DIRECTORY": "",
+    "DOWNLOAD_MISSING_GRAPH": False,
+    "USE_CONTRACTION_HIERARCHY": False,
+    "ROUTE_CACHE_SIZE": 10000,
+    "USER_TRACK_FREQUENCY": 30,
+    "ADAPTIVE_TRACKING": False,
+    "ADAPTIVE_TRACK_NEAR_GEOFENCE_METERS": 150,
+    "ADAPTIVE_TRACK_FAR_GEOFENCE_METERS": 800,
+    "ADAPTIVE_TRACK_RESPONSIVE_FREQUENCY": 5,
+    "ADAPTIVE_TRACK_EFFICIENT_FREQUENCY": 120,
+    "DEFAULT_GEOFENCE_RADIUS_METERS": 100,
+    "ALWAYS_TRACK_ON_NODES": False,
+    "ALWAYS_TRACK_ON_GEOFENCE_NODE": True,
+    "SIMULATE_TRIPS": True,
+    "REQUEST_BATCH_SIZE": 50,
+    "REQUEST_SHARDS": 4,
+    "REQUEST_QUEUE_LIMIT": 1000000,
+    "REQUEST_LATE_SECONDS": 10,
+    "MAX_RUN_TIME_SECONDS": 300,
+    "LIVE_VIEW": False,
+    "LIVE_VIEW_HEADLESS": True,
+    "LIVE_VIEW_FRAME_DIRECTORY": "",
+    "LIVE_VIEW_REFRESH_SECONDS": 2,
+    "LIVE_VIEW_MARKER_PIXELS": 3,
+    "MEMORY_PROFILING": False,
+    "MEMORY_SNAPSHOT_INTERVAL_SECONDS": 60,
+    "MEMORY_SNAPSHOT_TOP_ALLOCATIONS": 10,
+    "COORDINATOR_HOST": "127.0.0.1",
+    "COORDINATOR_PORT": 5055,
+    "DISTRIBUTED_WORKER_COUNT": 2,
+    "WORKER_HEARTBEAT_SECONDS": 5,
+    "WORKER_TIMEOUT_SECONDS": 20,
+    "WORKER_SETUP_TIMEOUT_SECONDS": 600
+}
+
+# Geofences as RadarRequests.get_simulation_geofences would return them
+GEOFENCES = [
+    {
+        "coordinates": [33.19246, -117.37554],
+        "radius": 100,
+        "is_trip_destination": True,
+        "description": "Regression Store",
+        "tag": "store",
+        "external_id": "regression-store"
+    },
+    {
+        "coordinates": [33.18796, -117.38092],
+        "radius": 150,
+        "is_trip_destination": False,
+        "description": "Regression Park",
+        "tag": "park",
+        "external_id": "regression-park"
+    },
+    {
+        "coordinates": [33.19516, -117.38199],
+        "radius": 75,
+        "is_trip_destination": True,
+        "description": "Regression Office",
+        "tag": "office",
+        "external_id": "regression-office"
+    }
+]
+
+SCENARIOS = [
+    {
+        "name": "fixed_rate_car",
+        "seed": 26,
+        "graph": {"rows": 15, "columns": 15, "spacing_meters": 100, "diagonal_chance": 0.2, "seed": 26},
+        "geofences": GEOFENCES,
+        "env": {}
+    },
+    {
+        "name": "adaptive_mixed_modes",
+        "seed": 30,
+        "graph": {"rows": 15, "columns": 15, "spacing_meters": 100, "diagonal_chance": 0.2, "seed": 30},
+        "geofences": GEOFENCES,
+        "env": {
+            "TRAVEL_MODE": ["car", "foot"],
+            "TRAVEL_MODE_SHARES": [0.6, 0.4],
+            "ADAPTIVE_TRACKING": True,
+            "USE_CONTRACTION_HIERARCHY": True
+        }
+    }
+]
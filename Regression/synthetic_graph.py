@@ -0,0 +1,86 @@
+from Network import distance
+from Network.street_graph import NETWORK_TYPES, get_graph_cache_path
+
+import os
+from itertools import count
+from random import Random
+
+import networkx as nx
+import osmnx as ox
+
+
+def build_grid_graph(center_cord, rows, columns, spacing_meters, diagonal_chance=0.0, seed=0, street_nodes=0):
+    """
+    Street grid shaped like an OSMNX graph, so scenarios never need a download.
+    Every street is two way, which keeps every node reachable from every other.
+    :param center_cord: (List[Float,Float]) Coordinate pair at the middle of the grid
+    :param rows: (Int) Nodes north to south
+    :param columns: (Int) Nodes east to west
+    :param spacing_meters: (Float) Block length
+    :param diagonal_chance: (Float) Chance each block gets a diagonal street, so routes are not all ties
+    :param seed: (Int) Seed for the diagonal streets
+    :param street_nodes: (Int) Extra nodes along every street, like the curve points of an unsimplified OSMNX graph
+    :return: (NetworkX MultiDiGraph)
+    """
+    rand = Random(seed)
+
+    lat_step = spacing_meters / distance.haversine_meters(center_cord[0], 0, center_cord[0] + 1, 0)
+    long_step = spacing_meters / distance.haversine_meters(center_cord[0], 0, center_cord[0], 1)
+
+    first_lat = center_cord[0] - lat_step * (rows - 1) / 2
+    first_long = center_cord[1] - long_step * (columns - 1) / 2
+
+    graph = nx.MultiDiGraph(crs="epsg:4326")
+
+    for row in range(0, rows):
+        for column in range(0, columns):
+            node = row * columns + column + 1
+            graph.add_node(node, osmid=node, y=first_lat + row * lat_step, x=first_long + column * long_step)
+
+    # Counted here, len(graph.edges) walks every edge
+    edge_ids = count(1)
+
+    def add_segment(u, v):
+        length = float(distance.haversine_meters(graph.nodes[u]["y"], graph.nodes[u]["x"], graph.nodes[v]["y"], graph.nodes[v]["x"]))
+        graph.add_edge(u, v, osmid=next(edge_ids), length=length, oneway=False)
+        graph.add_edge(v, u, osmid=next(edge_ids), length=length, oneway=False)
+
+    def add_street(u, v):
+        street = [u]
+        for step in range(1, street_nodes + 1):
+            node = graph.number_of_nodes() + 1
+            fraction = step / (street_nodes + 1)
+            graph.add_node(node, osmid=node,
+                           y=graph.nodes[u]["y"] + fraction * (graph.nodes[v]["y"] - graph.nodes[u]["y"]),
+                           x=graph.nodes[u]["x"] + fraction * (graph.nodes[v]["x"] - graph.nodes[u]["x"]))
+            street.append(node)
+        street.append(v)
+
+        for start, end in zip(street[:-1], street[1:]):
+            add_segment(start, end)
+
+    for row in range(0, rows):
+        for column in range(0, columns):
+            node = row * columns + column + 1
+            if column + 1 < columns:
+                add_street(node, node + 1)
+            if row + 1 < rows:
+                add_street(node, node + columns)
+            if row + 1 < rows and column + 1 < columns and rand.random() < diagonal_chance:
+                add_street(node, node + columns + 1)
+
+    return graph
+
+
+def write_synthetic_graph_cache(env, graph_options):
+    """
+    Write a synthetic grid into the graph cache of every travel mode, where StreetGraph loads it instead of downloading.
+    :param env: (Dictionary) Environment variables. GRAPH_CACHE_DIRECTORY and REGION_CENTRAL_COORD pick the files.
+    :param graph_options: (Dictionary) Keyword arguments for build_grid_graph, except center_cord
+    :return:
+    """
+    os.makedirs(env["GRAPH_CACHE_DIRECTORY"], exist_ok=True)
+
+    for travel_mode in env["TRAVEL_MODE"]:
+        graph = build_grid_graph(env["REGION_CENTRAL_COORD"], **graph_options)
+        ox.save_graphml(graph, get_graph_cache_path(env, NETWORK_TYPES[travel_mode]))
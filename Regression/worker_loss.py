@@ -0,0 +1,140 @@
+from Distributed.coordinator import Coordinator
+from Distributed.worker import Worker
+from Regression.file_sink import FileRequestSink
+from Regression.scenarios import BASE_ENV, SCENARIOS
+from Regression.synthetic_graph import write_synthetic_graph_cache
+
+import argparse
+import contextlib
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+# Car and foot graphs with contraction hierarchies, so every kind of cached graph file is sent to the workers
+SCENARIO_NAME = "adaptive_mixed_modes"
+
+
+def wait_for(condition, timeout):
+    """
+    Poll until a condition holds.
+    :param condition: (Function) Returns Bool
+    :param timeout: (Float) Seconds to wait
+    :return: (Bool) Condition held before the timeout
+    """
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+
+    return condition()
+
+
+def run_worker_loss(worker_count=3, timeout=60):
+    """
+    Start a Coordinator on a free port with in-process workers on a synthetic graph, kill one worker once every worker
+    is running and check that its traveller range moves to a surviving worker.
+    Each worker gets its own empty graph cache directory and downloads are off, so the run also checks workers route
+    on the graph files the Coordinator sends.
+    :param worker_count: (Int) Workers, each starting with one traveller range
+    :param timeout: (Float) Seconds to wait for each step
+    :return: (Bool) Passed
+    """
+    scenario = next(scenario for scenario in SCENARIOS if scenario["name"] == SCENARIO_NAME)
+
+    env = dict(BASE_ENV)
+    env.update(scenario["env"])
+    env.update({
+        "COORDINATOR_PORT": 0,
+        "DISTRIBUTED_WORKER_COUNT": worker_count,
+        "WORKER_HEARTBEAT_SECONDS": 0.2,
+        "WORKER_TIMEOUT_SECONDS": 5,
+        "WORKER_SETUP_TIMEOUT_SECONDS": timeout,
+        "MAX_RUN_TIME_SECONDS": timeout
+    })
+
+    failures = []
+
+    with tempfile.TemporaryDirectory() as cache_directory:
+        env["GRAPH_CACHE_DIRECTORY"] = os.path.join(cache_directory, "coordinator")
+        write_synthetic_graph_cache(env, scenario["graph"])
+
+        coordinator = Coordinator(env, radar_requests=FileRequestSink(env, scenario["geofences"]))
+
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            coordinator.prepare()
+            coordinator.start()
+
+            workers = [Worker(coordinator.host, coordinator.port, timeout=timeout, radar_requests=FileRequestSink(env, scenario["geofences"]),
+                              graph_cache_directory=os.path.join(cache_directory, f"worker_{worker_index}"))
+                       for worker_index in range(0, worker_count)]
+
+            worker_threads = []
+            for worker in workers:
+                worker_thread = threading.Thread(target=worker.run, daemon=True)
+                worker_thread.start()
+                worker_threads.append(worker_thread)
+
+            def all_workers_running():
+                with coordinator.lock:
+                    return (len(coordinator.workers) == worker_count and
+                            all(len(worker["metrics"]) > 0 for worker in coordinator.workers.values()))
+
+            if not wait_for(all_workers_running, timeout):
+                failures.append(f"{worker_count} workers did not all send a heartbeat within {timeout}s")
+            else:
+                lost_worker = workers[0]
+                with coordinator.lock:
+                    lost_ranges = list(coordinator.workers[lost_worker.worker_id]["ranges"])
+
+                # Like a crash, the Coordinator sees the connection drop without a finished message
+                lost_worker.connection.sock.shutdown(socket.SHUT_RDWR)
+
+                def lost_ranges_reassigned():
+                    with coordinator.lock:
+                        surviving_ranges = [traveller_range for worker_id, worker in coordinator.workers.items()
+                                            if worker_id != lost_worker.worker_id and worker["status"] == "running"
+                                            for traveller_range in worker["ranges"]]
+                    return all(traveller_range in surviving_ranges for traveller_range in lost_ranges)
+
+                if not wait_for(lost_ranges_reassigned, timeout):
+                    failures.append(f"lost ranges {lost_ranges} were not reassigned within {timeout}s")
+
+            coordinator.stop()
+            for worker_thread in worker_threads:
+                worker_thread.join(timeout)
+
+        report = coordinator.get_report()
+
+    if report["lost_workers"] != 1:
+        failures.append(f"{report['lost_workers']} workers lost, expected 1")
+    if len(report["unassigned_ranges"]) > 0:
+        failures.append(f"unassigned ranges {report['unassigned_ranges']}")
+
+    # Every traveller index must have been simulated by a surviving worker, none twice
+    surviving_travellers = sum(len(worker.simulator.traveller_list) for worker in workers[1:] if worker.simulator is not None)
+    if surviving_travellers != env["TOTAL_SIM_USERS"]:
+        failures.append(f"surviving workers simulated {surviving_travellers} travellers, expected {env['TOTAL_SIM_USERS']}")
+
+    print(f"{worker_count} workers, {report['lost_workers']} lost, {report['track_calls']} track calls, "
+          f"unassigned ranges {report['unassigned_ranges']}")
+    for failure in failures:
+        print(f"\tFAILED: {failure}")
+
+    return len(failures) == 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Kill a worker of a distributed run and check its travellers are reassigned.")
+    parser.add_argument("--workers", type=int, default=3, help="Workers to start")
+    parser.add_argument("--timeout", type=float, default=60, help="Seconds to wait for each step")
+    args = parser.parse_args()
+
+    if not run_worker_loss(args.workers, args.timeout):
+        print("WORKER LOSS FAILED")
+        sys.exit(1)
+
+    print("Worker loss passed.")
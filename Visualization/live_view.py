@@ -0,0 +1,152 @@
+from Network.street_graph import StreetGraph
+
+import os
+
+import matplotlib.pyplot as plt
+import numpy
+import osmnx as ox
+from PIL import Image
+
+# RGB marker colors, close to the ones StreetGraph.visualize uses
+TRAVEL_MODE_COLORS = {
+    "car": (255, 64, 64),
+    "foot": (255, 220, 0)
+}
+TOWER_COLOR = (0, 255, 0)
+GEOFENCE_COLOR = (64, 128, 255)
+
+
+class LiveMapView:
+    """
+    Map of traveller positions that is cheap enough to refresh while a simulation runs.
+    The street network is drawn once with OSMNX into a cached background image. A refresh copies the background and
+    paints traveller, tower and geofence markers straight into the pixel array, so its cost grows with the number of
+    markers instead of the size of the network. Headless mode writes each frame to disk instead of showing a window.
+    """
+
+    background = None
+    frame_count = 0
+    last_refresh_clock = None
+
+    figure = None
+    image = None
+
+    def __init__(self, street_graph: StreetGraph, env):
+        self.headless = env["LIVE_VIEW_HEADLESS"]
+        self.frame_directory = env["LIVE_VIEW_FRAME_DIRECTORY"]
+        self.refresh_frequency = env["LIVE_VIEW_REFRESH_SECONDS"]
+        self.marker_size = env["LIVE_VIEW_MARKER_PIXELS"]
+
+        self.frame_count = 0
+        self.last_refresh_clock = None
+
+        if self.headless:
+            plt.switch_backend("Agg")
+            os.makedirs(self.frame_directory, exist_ok=True)
+
+        self.render_background(street_graph)
+
+        if not self.headless:
+            plt.ion()
+            self.figure = plt.figure(figsize=(self.background.shape[1] / 100, self.background.shape[0] / 100), dpi=100)
+            self.figure.add_axes([0, 0, 1, 1]).set_axis_off()
+            self.image = self.figure.axes[0].imshow(self.background, interpolation="nearest")
+            plt.show(block=False)
+
+    def render_background(self, street_graph: StreetGraph):
+        """
+        Draw the street network once and keep it as an RGB array, along with the mapping from coordinates to pixels.
+        :param street_graph: (StreetGraph)
+        :return: None (Background saved to memory)
+        """
+        fig, ax = ox.plot_graph(street_graph.graph, node_size=0, edge_color="#666666", edge_linewidth=0.5,
+                                bgcolor="k", show=False, close=False)
+        fig.canvas.draw()
+
+        self.background = numpy.asarray(fig.canvas.buffer_rgba())[:, :, :3].copy()
+
+        # The plot is linear in long / lat, so two corners give the whole mapping. Display y grows upwards, rows grow down.
+        (long_min, long_max), (lat_min, lat_max) = ax.get_xlim(), ax.get_ylim()
+        (x_min, y_min), (x_max, y_max) = ax.transData.transform([[long_min, lat_min], [long_max, lat_max]])
+
+        self.col_per_long = (x_max - x_min) / (long_max - long_min)
+        self.col_offset = x_min - long_min * self.col_per_long
+        self.row_per_lat = -(y_max - y_min) / (lat_max - lat_min)
+        self.row_offset = self.background.shape[0] - y_min - lat_min * self.row_per_lat
+
+        plt.close(fig)
+
+    def is_refresh_due(self, clock_time):
+        """
+        :param clock_time: (Float) Current simulation clock time
+        :return: (Bool) LIVE_VIEW_REFRESH_SECONDS have passed since the last refresh
+        """
+        return self.last_refresh_clock is None or clock_time - self.last_refresh_clock >= self.refresh_frequency
+
+    def refresh(self, snapshot, clock_time):
+        """
+        Draw a frame from a position snapshot and show it or write it to disk.
+        :param snapshot: (Dictionary) Refer to Simulator.get_position_snapshot
+        :param clock_time: (Float) Current simulation clock time
+        :return:
+        """
+        self.last_refresh_clock = clock_time
+
+        frame = self.render_frame(snapshot)
+
+        if self.headless:
+            frame_path = os.path.join(self.frame_directory, f"frame_{self.frame_count:06d}.png")
+            Image.fromarray(frame).save(frame_path, compress_level=1)
+        else:
+            self.image.set_data(frame)
+            self.figure.canvas.draw_idle()
+            self.figure.canvas.flush_events()
+
+        self.frame_count += 1
+
+    def render_frame(self, snapshot):
+        """
+        Paint the snapshot's markers over a copy of the background.
+        :param snapshot: (Dictionary) Refer to Simulator.get_position_snapshot
+        :return: (Array[H,W,3]) RGB frame
+        """
+        frame = self.background.copy()
+
+        for travel_mode, cords in snapshot["travellers"].items():
+            self.draw_markers(frame, cords, TRAVEL_MODE_COLORS.get(travel_mode, (255, 255, 255)), self.marker_size)
+
+        # Drawn last so crowds of Travellers never hide them
+        self.draw_markers(frame, snapshot["geofences"], GEOFENCE_COLOR, self.marker_size + 4)
+        self.draw_markers(frame, snapshot["towers"], TOWER_COLOR, self.marker_size + 4)
+
+        return frame
+
+    def draw_markers(self, frame, cords, color, size):
+        """
+        Paint a square marker for every coordinate pair, all markers at once for each pixel of the square.
+        :param frame: (Array[H,W,3]) RGB frame, painted in place
+        :param cords: (Array[N,2]) (lat, long) rows
+        :param color: (Tuple(Int, Int, Int)) RGB
+        :param size: (Int) Marker width in pixels
+        :return:
+        """
+        if len(cords) == 0:
+            return
+
+        rows = numpy.rint(cords[:, 0] * self.row_per_lat + self.row_offset).astype(int)
+        cols = numpy.rint(cords[:, 1] * self.col_per_long + self.col_offset).astype(int)
+
+        half_size = size // 2
+        for row_offset in range(-half_size, size - half_size):
+            for col_offset in range(-half_size, size - half_size):
+                marker_rows = numpy.clip(rows + row_offset, 0, frame.shape[0] - 1)
+                marker_cols = numpy.clip(cols + col_offset, 0, frame.shape[1] - 1)
+                frame[marker_rows, marker_cols] = color
+
+    def close(self):
+        """
+        Close the window, if there is one.
+        :return:
+        """
+        if self.figure is not None:
+            plt.close(self.figure)
@@ -0,0 +1,46 @@
+import time
+
+
+class SystemClock:
+    """
+    Wall clock. Used by every normal run.
+    """
+
+    def time(self):
+        """
+        :return: (Float) Seconds since the epoch
+        """
+        return time.time()
+
+    def sleep(self, seconds):
+        """
+        :param seconds: (Float) Seconds to block for
+        :return:
+        """
+        time.sleep(seconds)
+
+
+class VirtualClock:
+    """
+    Clock that only moves when slept on. Simulated time no longer depends on how fast the machine runs the loop,
+    so a seeded run replays the same way every time.
+    """
+
+    current_time = 0
+
+    def __init__(self, start_time=0):
+        self.current_time = start_time
+
+    def time(self):
+        """
+        :return: (Float) Virtual seconds
+        """
+        return self.current_time
+
+    def sleep(self, seconds):
+        """
+        Advance virtual time without blocking.
+        :param seconds: (Float) Seconds to advance
+        :return:
+        """
+        self.current_time += seconds
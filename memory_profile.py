@@ -0,0 +1,201 @@
+import sys
+import tracemalloc
+import types
+
+import numpy
+
+# Never followed into. Code and singletons belong to the interpreter, not to the simulation.
+UNSIZED_TYPES = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType, bool, type(None))
+
+
+def get_deep_size(obj, seen=None):
+    """
+    Bytes held by an object and everything it references that has not been counted yet.
+    Sharing one seen set across calls attributes each shared object to the first thing measured, so totals never double count.
+    NumPy arrays are counted by their buffer, including the base array of a view.
+    :param obj: (Any) Object to measure
+    :param seen: (Set[Int]) IDs of objects already counted. Updated in place.
+    :return: (Int) Bytes
+    """
+    if seen is None:
+        seen = set()
+
+    size = 0
+    pending = [obj]
+    while len(pending) > 0:
+        item = pending.pop()
+
+        if id(item) in seen or isinstance(item, UNSIZED_TYPES):
+            continue
+        seen.add(id(item))
+
+        size += sys.getsizeof(item)
+
+        if isinstance(item, numpy.ndarray):
+            if item.base is not None:
+                pending.append(item.base)
+        elif isinstance(item, dict):
+            pending.extend(item.keys())
+            pending.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            pending.extend(item)
+        elif not isinstance(item, (str, bytes, int, float)):
+            if hasattr(item, "__dict__"):
+                pending.append(item.__dict__)
+
+            for cls in type(item).__mro__:
+                for slot in getattr(cls, "__slots__", ()):
+                    if hasattr(item, slot):
+                        pending.append(getattr(item, slot))
+
+    return size
+
+
+class MemoryProfiler:
+    """
+    Memory accounting for a Simulator. Attributes bytes to Travellers, their routes, the street graphs and the caches,
+    and takes tracemalloc snapshots every MEMORY_SNAPSHOT_INTERVAL_SECONDS to show where allocations grow.
+    Per Traveller costs are projected to TOTAL_SIM_USERS, so machines can be sized before a large run.
+    """
+
+    snapshot_frequency = 0
+    top_allocation_count = 0
+    last_snapshot_clock = None
+
+    baseline_traced_bytes = 0
+    last_snapshot = None
+    snapshot_count = 0
+
+    def __init__(self, env):
+        self.snapshot_frequency = env["MEMORY_SNAPSHOT_INTERVAL_SECONDS"]
+        self.top_allocation_count = env["MEMORY_SNAPSHOT_TOP_ALLOCATIONS"]
+        self.total_users = env["TOTAL_SIM_USERS"]
+
+        self.last_snapshot_clock = None
+        self.baseline_traced_bytes = 0
+        self.last_snapshot = None
+        self.snapshot_count = 0
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def mark_baseline(self):
+        """
+        Record traced memory once the shared setup (graphs, geofences, live view) is done and before any Traveller exists.
+        Growth past it is what the Travellers cost.
+        :return:
+        """
+        self.baseline_traced_bytes = tracemalloc.get_traced_memory()[0]
+
+    def is_snapshot_due(self, clock_time):
+        """
+        :param clock_time: (Float) Current simulation clock time
+        :return: (Bool) MEMORY_SNAPSHOT_INTERVAL_SECONDS have passed since the last snapshot
+        """
+        return self.last_snapshot_clock is None or clock_time - self.last_snapshot_clock >= self.snapshot_frequency
+
+    def get_report(self, simulator):
+        """
+        Account the memory held by a Simulator.
+        Graphs are measured first, so node IDs shared with routes count towards the graph. Cached routes are measured
+        before Travellers, so Travellers only pay for routes the cache no longer holds.
+        :param simulator: (Simulator)
+        :return: (Dictionary) Memory report. Sizes in bytes.
+        """
+        seen = set()
+
+        # Shared by every Traveller and reported on their own, or not part of the simulation state at all
+        for shared in [simulator.request_dispatcher, simulator.radar_requests, simulator.track_policy, simulator.clock,
+                       simulator.env_vars, simulator.live_view, self]:
+            seen.add(id(shared))
+
+        graph_bytes = 0
+        route_cache_bytes = 0
+        contraction_hierarchy_bytes = 0
+        for street_graph in simulator.street_graphs.values():
+            caches = [street_graph.route_cache, street_graph.contraction_hierarchy]
+            seen.update(id(cache) for cache in caches)
+            graph_bytes += get_deep_size(street_graph, seen)
+            seen.difference_update(id(cache) for cache in caches)
+
+            route_cache_bytes += get_deep_size(street_graph.route_cache, seen)
+            contraction_hierarchy_bytes += get_deep_size(street_graph.contraction_hierarchy, seen)
+
+        profile_bytes = get_deep_size(simulator.traveler_profiles, seen)
+
+        route_bytes = 0
+        traveller_bytes = 0
+        for T in simulator.traveller_list:
+            route_bytes += get_deep_size(T.ox_node_route, seen)
+            route_bytes += get_deep_size(T.edge_travel_times, seen)
+            route_bytes += get_deep_size(T.ox_destinations, seen)
+            traveller_bytes += get_deep_size(T, seen)
+
+        traveller_count = max(len(simulator.traveller_list), 1)
+        shared_bytes = graph_bytes + route_cache_bytes + contraction_hierarchy_bytes + profile_bytes
+        bytes_per_traveller = (traveller_bytes + route_bytes) / traveller_count
+
+        traced_bytes, traced_peak_bytes = tracemalloc.get_traced_memory()
+
+        return {
+            "travellers": len(simulator.traveller_list),
+            "graph_bytes": graph_bytes,
+            "route_cache_bytes": route_cache_bytes,
+            "route_cache_routes": sum(len(street_graph.route_cache) for street_graph in simulator.street_graphs.values()),
+            "contraction_hierarchy_bytes": contraction_hierarchy_bytes,
+            "profile_bytes": profile_bytes,
+            "traveller_bytes": traveller_bytes,
+            "route_bytes": route_bytes,
+            "bytes_per_traveller": bytes_per_traveller,
+            "traced_bytes": traced_bytes,
+            "traced_peak_bytes": traced_peak_bytes,
+            "traced_bytes_per_traveller": (traced_bytes - self.baseline_traced_bytes) / traveller_count,
+            "projected_users": self.total_users,
+            "projected_bytes": shared_bytes + bytes_per_traveller * self.total_users
+        }
+
+    def take_snapshot(self, simulator, clock_time):
+        """
+        Print the memory report and the allocation sites that grew the most since the last snapshot.
+        :param simulator: (Simulator)
+        :param clock_time: (Float) Current simulation clock time
+        :return:
+        """
+        self.last_snapshot_clock = clock_time
+        self.snapshot_count += 1
+
+        snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+
+        print(f"Memory Snapshot {self.snapshot_count}:")
+        self.print_report(simulator)
+
+        if self.last_snapshot is None:
+            top_allocations = snapshot.statistics("lineno")[:self.top_allocation_count]
+        else:
+            top_allocations = snapshot.compare_to(self.last_snapshot, "lineno")[:self.top_allocation_count]
+
+        print("\tTop Allocations:")
+        for allocation in top_allocations:
+            print(f"\t\t{allocation}")
+
+        self.last_snapshot = snapshot
+
+    def print_report(self, simulator):
+        """
+        Print the memory report.
+        :param simulator: (Simulator)
+        :return:
+        """
+        report = self.get_report(simulator)
+
+        def mib(size):
+            return f"{size / 1024 / 1024:.2f}MiB"
+
+        print(f"\tStreet Graphs: {mib(report['graph_bytes'])}")
+        print(f"\tRoute Cache: {mib(report['route_cache_bytes'])} ({report['route_cache_routes']} routes)")
+        print(f"\tContraction Hierarchy: {mib(report['contraction_hierarchy_bytes'])}")
+        print(f"\tTravellers: {mib(report['traveller_bytes'])} + Routes: {mib(report['route_bytes'])} "
+              f"for {report['travellers']} ({report['bytes_per_traveller']:.0f} bytes each)")
+        print(f"\tTraced: {mib(report['traced_bytes'])} (Peak {mib(report['traced_peak_bytes'])}, "
+              f"{report['traced_bytes_per_traveller']:.0f} bytes per Traveller over the setup baseline)")
+        print(f"\tProjected for {report['projected_users']} Travellers: {mib(report['projected_bytes'])}")
@@ -1,21 +1,71 @@
 from typing import List, Any
 
-from traveller import Traveler
+from traveller import Traveler, TravelerProfile
 from Radar.radar_requests import RadarRequests
+from Radar.request_dispatcher import RadarRequestDispatcher
 from Network.street_graph import StreetGraph
+from track_policy import create_track_policy
+from clock import SystemClock
+from memory_profile import MemoryProfiler
 
 import json
-import time
+import numpy
+import uuid
 from random import random, choice
 
 ENVIRONMENT_FILE_PATH = "./Environment.json"
 
 
+def load_environment(path=ENVIRONMENT_FILE_PATH):
+    """
+    Load the environment variables used by every part of the simulation.
+    :param path: (String) Environment JSON file path
+    :return: (Dictionary) Environment variables
+    """
+    with open(path) as json_file:
+        return json.load(json_file)
+
+
+def get_travel_mode_counts(env):
+    """
+    Split TOTAL_SIM_USERS over TRAVEL_MODE by TRAVEL_MODE_SHARES. Rounding left overs go to the last travel mode.
+    :param env: (Dictionary) Environment variables
+    :return: (Dictionary) Travel mode -> number of Travellers, in TRAVEL_MODE order
+    """
+    travel_modes = env["TRAVEL_MODE"]
+    travel_mode_shares = env["TRAVEL_MODE_SHARES"]
+
+    if len(travel_modes) == 0 or len(travel_modes) != len(travel_mode_shares):
+        raise ValueError("TRAVEL_MODE_SHARES must have one share for each TRAVEL_MODE")
+
+    total_users = env["TOTAL_SIM_USERS"]
+    total_share = sum(travel_mode_shares)
+
+    travel_mode_counts = {}
+    assigned_users = 0
+    for travel_mode, share in zip(travel_modes[:-1], travel_mode_shares[:-1]):
+        travel_mode_counts[travel_mode] = int(total_users * share / total_share)
+        assigned_users += travel_mode_counts[travel_mode]
+
+    travel_mode_counts[travel_modes[-1]] = total_users - assigned_users
+
+    return travel_mode_counts
+
+
 class Simulator:
     radar_requests = None
+    request_dispatcher = None
     street_graph = None
+    street_graphs = None
+    track_policy = None
+    traveler_profiles = None
+    live_view = None
+    memory_profiler = None
+
+    travel_mode_counts = None
 
     traveller_list: list[Traveler] = []
+    run_id = None
 
     roll1 = 0
     roll2 = 0
@@ -30,52 +80,135 @@ class Simulator:
 
     run_throttle = 0.2
     max_run_time = 0
+    update_count = 0
 
-    def __init__(self):
-        with open(ENVIRONMENT_FILE_PATH) as json_file:
-            env_vars = json.load(json_file)
-
-            self.street_graph = StreetGraph(env_vars)
-            self.radar_requests = RadarRequests(env_vars)
-
-            self.total_users = env_vars["TOTAL_SIM_USERS"]
-            self.max_run_time = env_vars["MAX_RUN_TIME_SECONDS"]
+    def __init__(self, env_vars=None, geofences=None, traveller_id_range=None, run_id=None, radar_requests=None, clock=None,
+                 tower_cords=None):
+        """
+        :param env_vars: (Dictionary) Environment variables. Defaults to the contents of Environment.json
+        :param geofences: (List[Dictionary]) Geofences to register. Defaults to retrieving them from Radar.
+        :param traveller_id_range: ([Int, Int]) Traveller indices [start, end) to simulate. Defaults to all TOTAL_SIM_USERS.
+        :param run_id: (String) Shared by every Traveller ID in the run. Defaults to a random value.
+        :param radar_requests: (RadarRequests) Where requests are sent. Defaults to the Radar API.
+        :param clock: (SystemClock or VirtualClock) Time source for the run. Defaults to the wall clock.
+        :param tower_cords: (List[[Float, Float]]) Tower coordinates. Defaults to TOTAL_LOCATION_TOWERS random nodes.
+        """
+        if env_vars is None:
+            env_vars = load_environment()
+        self.env_vars = env_vars
+
+        if clock is None:
+            clock = SystemClock()
+        self.clock = clock
+
+        # Started before anything is built, so every allocation of the run is traced
+        if env_vars["MEMORY_PROFILING"]:
+            self.memory_profiler = MemoryProfiler(env_vars)
+
+        self.travel_mode_counts = get_travel_mode_counts(env_vars)
+
+        # One street network per travel mode in use, shared by all of its Travellers. Towers are placed once and shared.
+        self.street_graphs = {}
+        for travel_mode, count in self.travel_mode_counts.items():
+            if count == 0:
+                continue
+
+            if self.street_graph is None:
+                self.street_graph = StreetGraph(env_vars, travel_mode, tower_cords=tower_cords)
+                self.street_graphs[travel_mode] = self.street_graph
+            else:
+                self.street_graphs[travel_mode] = StreetGraph(env_vars, travel_mode, tower_cords=self.street_graph.tower_cords)
+
+        if radar_requests is None:
+            radar_requests = RadarRequests(env_vars)
+        self.radar_requests = radar_requests
+        self.request_dispatcher = RadarRequestDispatcher(self.radar_requests, env_vars)
+        self.track_policy = create_track_policy(env_vars)
+        self.default_geofence_radius = env_vars["DEFAULT_GEOFENCE_RADIUS_METERS"]
+
+        self.total_users = env_vars["TOTAL_SIM_USERS"]
+        self.max_run_time = env_vars["MAX_RUN_TIME_SECONDS"]
+
+        self.chance_to_travel_to_geofence = env_vars["CHANCE_TO_TRAVEL_TO_GEOFENCE"]
+        self.chance_to_travel_to_multiple_nodes = env_vars["CHANCE_TO_TRAVEL_TO_MULTIPLE_NODES"]
+
+        if run_id is None:
+            run_id = uuid.uuid4().hex[:8]
+        self.run_id = run_id
+
+        if traveller_id_range is None:
+            traveller_id_range = [0, self.total_users]
+
+        # Settings shared by every Traveller of a travel mode
+        self.traveler_profiles = {}
+        for travel_mode, street_graph in self.street_graphs.items():
+            self.traveler_profiles[travel_mode] = TravelerProfile(env_vars, travel_mode, radar_requests=self.request_dispatcher,
+                                                                  street_graph=street_graph, track_policy=self.track_policy,
+                                                                  clock=self.clock)
+
+        self.load_geofences(geofences)
+
+        if env_vars["LIVE_VIEW"]:
+            # Imported here so runs without a live view never load the plotting stack
+            from Visualization.live_view import LiveMapView
+            self.live_view = LiveMapView(self.street_graph, env_vars)
+
+        # Travellers are created last, so everything traced past the baseline is per Traveller state
+        if self.memory_profiler is not None:
+            self.memory_profiler.mark_baseline()
+
+        self.traveller_list = []
+        self.add_travellers(traveller_id_range[0], traveller_id_range[1])
+
+    def add_travellers(self, start_index, end_index):
+        """
+        Create the Travellers for a range of traveller indices. Indices are unique across a run, even a distributed one.
+        :param start_index: (Int) First traveller index
+        :param end_index: (Int) Traveller index to stop before
+        :return:
+        """
+        for index in range(start_index, end_index):
+            travel_mode = self.get_travel_mode_for_index(index)
 
-            self.chance_to_travel_to_geofence = env_vars["CHANCE_TO_TRAVEL_TO_GEOFENCE"]
-            self.chance_to_travel_to_multiple_nodes = env_vars["CHANCE_TO_TRAVEL_TO_MULTIPLE_NODES"]
+            T = Traveler(self.traveler_profiles[travel_mode], traveller_id=f"{self.run_id}_{index}")
+            self.traveller_list.append(T)
 
-            for index in range(0, self.total_users):
-                T = Traveler(env_vars, "car", radar_requests=self.radar_requests, street_graph=self.street_graph)
-                self.traveller_list.append(T)
+    def get_travel_mode_for_index(self, index):
+        """
+        Travel mode of a traveller index. Indices are handed out to travel modes in TRAVEL_MODE order.
+        :param index: (Int) Traveller index
+        :return: (String) Travel mode
+        """
+        for travel_mode, count in self.travel_mode_counts.items():
+            if index < count:
+                return travel_mode
+            index -= count
 
-            self.load_geofences()
+        raise ValueError("Traveller index is outside of TOTAL_SIM_USERS")
 
-    def load_geofences(self):
+    def load_geofences(self, geofences=None):
         """
-        Retrieve geofences in Radar relative to StreetGraph and register them into the StreetGraph
+        Retrieve geofences in Radar relative to StreetGraph and register them into the StreetGraph of every travel mode
+        :param geofences: (List[Dictionary]) Already retrieved geofences. Refer to RadarRequests.get_simulation_geofences
         :return:
         """
-        graph_centroid = self.street_graph.focal_point
-        graph_size = self.street_graph.graph_size_in_meters
-        nearby_geofences = self.radar_requests.get_nearby_geofences(graph_centroid, radius=graph_size)["geofences"]
+        if geofences is None:
+            graph_centroid = self.street_graph.focal_point
+            graph_size = self.street_graph.graph_size_in_meters
+            geofences = self.radar_requests.get_simulation_geofences(graph_centroid, graph_size,
+                                                                     default_geofence_radius=self.default_geofence_radius)
 
         geofences_added = []
-        for geofence in nearby_geofences:
-            geofence_cord = geofence["geometryCenter"]["coordinates"]
-
-            # I THOUGHT IT WAS LAT LONG !! Need to swap I guess
-            updated_geofence_cord = [geofence_cord[1], geofence_cord[0]]
-
+        for geofence in geofences:
             geofences_added.append(geofence["description"])
 
-            simulate_trip = False
-            if "metadata" in geofence:
-                if "trip_destination" in geofence["metadata"]:
-                    simulate_trip = geofence["metadata"]["trip_destination"]
-
-            self.street_graph.add_geofences_by_coords(updated_geofence_cord,
-                                                      is_trip_destination=simulate_trip,
-                                                      description=geofence["description"])
+            for street_graph in self.street_graphs.values():
+                street_graph.add_geofences_by_coords(geofence["coordinates"],
+                                                     is_trip_destination=geofence["is_trip_destination"],
+                                                     description=geofence["description"],
+                                                     radius=geofence["radius"],
+                                                     tag=geofence["tag"],
+                                                     external_id=geofence["external_id"])
 
         print(f"Geofences Added to Graph: \n\t{geofences_added}")
 
@@ -87,15 +220,16 @@ class Simulator:
         (3) Updates Travellers positions
         :return:
         """
-        self.run_clock = time.time()
+        self.run_clock = self.clock.time()
         self.fixed_update_clock = self.run_clock
 
         while True:
-            time.sleep(self.run_throttle)  # Throttle Update Loop
+            self.clock.sleep(self.run_throttle)  # Throttle Update Loop
 
             # Terminate
-            run_time = time.time() - self.run_clock
+            run_time = self.clock.time() - self.run_clock
             if run_time > self.max_run_time:
+                self.finish()
                 return
 
             # Reroll Update ( Thought I would need this. Going to just save for now )
@@ -104,19 +238,92 @@ class Simulator:
             #     self.reroll()
             #     self.fixed_update_clock = time.time()
 
-            # Update Travellers
-            for T in self.traveller_list:
-                if not T.travelling:
-                    ox_origin_node = self.get_random_traveller_node()
-                    ox_destination_nodes = self.get_random_destination_node_list()
+            self.update_travellers()
+
+    def finish(self):
+        """
+        Send every queued request, print the run reports and close the live view.
+        :return:
+        """
+        self.request_dispatcher.shutdown()
+        self.track_policy.print_report()
+        self.request_dispatcher.print_report()
+
+        if self.memory_profiler is not None:
+            print("Memory Report:")
+            self.memory_profiler.print_report(self)
+
+        if self.live_view is not None:
+            self.live_view.close()
+
+    def update_travellers(self):
+        """
+        Start idle Travellers on a new journey and move the rest along their routes.
+        :return:
+        """
+        self.update_count += 1
+
+        for T in self.traveller_list:
+            if not T.travelling:
+                ox_origin_node = self.get_random_traveller_node(T.street_graph)
+                ox_destination_nodes = self.get_random_destination_node_list(T.street_graph)
+
+                # This might prove to be troublesome with certain setups.
+                while ox_origin_node == ox_destination_nodes[0]:
+                    ox_destination_nodes = self.get_random_destination_node_list(T.street_graph)
+
+                T.start(ox_origin_node, ox_destination_nodes)
+            else:
+                T.update_position()
+
+        self.request_dispatcher.flush()
 
-                    # This might prove to be troublesome with certain setups.
-                    while ox_origin_node == ox_destination_nodes[0]:
-                        ox_destination_nodes = self.get_random_destination_node_list()
+        if self.live_view is not None and self.live_view.is_refresh_due(self.clock.time()):
+            self.live_view.refresh(self.get_position_snapshot(), self.clock.time())
 
-                    T.start(ox_origin_node, ox_destination_nodes)
-                else:
-                    T.update_position()
+        if self.memory_profiler is not None and self.memory_profiler.is_snapshot_due(self.clock.time()):
+            self.memory_profiler.take_snapshot(self, self.clock.time())
+
+    def get_position_snapshot(self):
+        """
+        Copy of every position the live view draws, so a frame never sees Travellers mid update.
+        :return: (Dictionary) "travellers": travel mode -> Array[N,2] of travelling positions,
+                              "towers": Array[N,2], "geofences": Array[N,2]
+        """
+        traveller_cords = {travel_mode: [] for travel_mode in self.street_graphs}
+        for T in self.traveller_list:
+            if T.travelling:
+                traveller_cords[T.travel_mode].append(T.cord_current_position)
+
+        return {
+            "travellers": {travel_mode: numpy.array(cords, dtype=float).reshape(-1, 2)
+                           for travel_mode, cords in traveller_cords.items()},
+            "towers": self.street_graph.tower_cords.copy(),
+            "geofences": numpy.array(self.street_graph.geofence_cords, dtype=float).reshape(-1, 2)
+        }
+
+    def get_metrics(self):
+        """
+        Running totals for this Simulator. Sent by distributed workers as heartbeats.
+        :return: (Dictionary) Metrics
+        """
+        travelling = 0
+        for T in self.traveller_list:
+            if T.travelling:
+                travelling += 1
+
+        return {
+            "travellers": len(self.traveller_list),
+            "travelling": travelling,
+            "updates": self.update_count,
+            "track_calls": self.track_policy.track_calls,
+            "fixed_rate_track_calls": self.track_policy.fixed_rate_track_calls,
+            "trips_started": self.request_dispatcher.trips_started,
+            "trips_completed": self.request_dispatcher.trips_completed,
+            "request_backlog": self.request_dispatcher.get_report()["request_backlog"],
+            "route_cache_hits": sum(street_graph.route_cache_hits for street_graph in self.street_graphs.values()),
+            "route_cache_misses": sum(street_graph.route_cache_misses for street_graph in self.street_graphs.values())
+        }
 
     def reroll(self):
         """
@@ -136,29 +343,32 @@ class Simulator:
         # return choice([self.roll1, self.roll2, self.roll3])
         return random()
 
-    def get_random_destination_node_list(self):
+    def get_random_destination_node_list(self, street_graph: StreetGraph):
         """
         Create a list of random destinations for Traveller based on chance context
+        :param street_graph: (StreetGraph) The Traveller's street network
         :return:
         """
-        ox_destination_nodes = [self.get_random_traveller_node()]
+        ox_destination_nodes = [self.get_random_traveller_node(street_graph)]
 
         while self.get_chance() < self.chance_to_travel_to_multiple_nodes:
-            ox_destination_nodes.append(self.get_random_traveller_node())
+            ox_destination_nodes.append(self.get_random_traveller_node(street_graph))
 
         return ox_destination_nodes
 
-    def get_random_traveller_node(self):
+    def get_random_traveller_node(self, street_graph: StreetGraph):
         """
         Retrieve a random ox_node for the Traveller based on chance context
+        :param street_graph: (StreetGraph) The Traveller's street network
         :return:
         """
         if self.get_chance() < self.chance_to_travel_to_geofence:
-            return self.street_graph.get_random_geofence_node()
+            return street_graph.get_random_geofence_node()
         else:
-            return self.street_graph.get_random_ox_node()
+            return street_graph.get_random_ox_node()
 
 
-S = Simulator()
-# S.street_graph.visualize()
-S.run()
+if __name__ == "__main__":
+    S = Simulator()
+    # S.street_graph.visualize()
+    S.run()
@@ -0,0 +1,118 @@
+class TrackPolicy:
+    """
+    Fixed rate tracking. Travellers track every USER_TRACK_FREQUENCY seconds no matter where they are.
+    The policy is shared by every Traveller so it also keeps the tracking report for the run.
+    """
+
+    fixed_track_frequency = 0
+
+    track_calls = 0
+    fixed_rate_track_calls = 0
+
+    geofence_transitions = 0
+    tracked_geofence_transitions = 0
+
+    def __init__(self, env):
+        self.fixed_track_frequency = env["USER_TRACK_FREQUENCY"]
+
+        self.track_calls = 0
+        self.fixed_rate_track_calls = 0
+
+        self.geofence_transitions = 0
+        self.tracked_geofence_transitions = 0
+
+    def get_track_frequency(self, geofence_distance_meters):
+        """
+        Seconds a Traveller should wait between timed track calls.
+        :param geofence_distance_meters: (Float) Distance from the Traveller to the nearest geofence edge.
+        :return: (Float) Seconds between track calls
+        """
+        return self.fixed_track_frequency
+
+    def get_report(self):
+        """
+        Summarize the track calls made against what fixed rate tracking would have made over the same run.
+        Geofence transitions are entries / exits that actually happened, tracked transitions are the ones a track call observed.
+        :return: (Dictionary) Tracking report
+        """
+        calls_saved = self.fixed_rate_track_calls - self.track_calls
+
+        calls_saved_percentage = 0
+        if self.fixed_rate_track_calls > 0:
+            calls_saved_percentage = 100 * calls_saved / self.fixed_rate_track_calls
+
+        event_fidelity_percentage = 100
+        if self.geofence_transitions > 0:
+            event_fidelity_percentage = 100 * self.tracked_geofence_transitions / self.geofence_transitions
+
+        return {
+            "track_calls": self.track_calls,
+            "fixed_rate_track_calls": self.fixed_rate_track_calls,
+            "calls_saved": calls_saved,
+            "calls_saved_percentage": calls_saved_percentage,
+            "geofence_transitions": self.geofence_transitions,
+            "tracked_geofence_transitions": self.tracked_geofence_transitions,
+            "event_fidelity_percentage": event_fidelity_percentage
+        }
+
+    def print_report(self):
+        """
+        Print the tracking report.
+        :return:
+        """
+        report = self.get_report()
+
+        print(f"Track Calls: {report['track_calls']} (Fixed Rate: {report['fixed_rate_track_calls']})")
+        print(f"\tCalls Saved: {report['calls_saved']} ({report['calls_saved_percentage']:.1f}%)")
+        print(f"Geofence Transitions Tracked: {report['tracked_geofence_transitions']} / {report['geofence_transitions']}")
+        print(f"\tEvent Fidelity: {report['event_fidelity_percentage']:.1f}%")
+
+
+class AdaptiveTrackPolicy(TrackPolicy):
+    """
+    Geofence proximity tracking, similar to the SDK's responsive / efficient modes.
+    Travellers near a geofence track at the responsive frequency, far away at the efficient frequency,
+    and in between the frequency is interpolated on distance.
+    """
+
+    near_geofence_meters = 0
+    far_geofence_meters = 0
+
+    responsive_track_frequency = 0
+    efficient_track_frequency = 0
+
+    def __init__(self, env):
+        super().__init__(env)
+
+        self.near_geofence_meters = env["ADAPTIVE_TRACK_NEAR_GEOFENCE_METERS"]
+        self.far_geofence_meters = env["ADAPTIVE_TRACK_FAR_GEOFENCE_METERS"]
+
+        self.responsive_track_frequency = env["ADAPTIVE_TRACK_RESPONSIVE_FREQUENCY"]
+        self.efficient_track_frequency = env["ADAPTIVE_TRACK_EFFICIENT_FREQUENCY"]
+
+    def get_track_frequency(self, geofence_distance_meters):
+        """
+        Seconds a Traveller should wait between timed track calls.
+        :param geofence_distance_meters: (Float) Distance from the Traveller to the nearest geofence edge.
+        :return: (Float) Seconds between track calls
+        """
+        if geofence_distance_meters <= self.near_geofence_meters:
+            return self.responsive_track_frequency
+        elif geofence_distance_meters >= self.far_geofence_meters:
+            return self.efficient_track_frequency
+
+        perc_to_far = (geofence_distance_meters - self.near_geofence_meters) / (self.far_geofence_meters - self.near_geofence_meters)
+
+        return self.responsive_track_frequency + (self.efficient_track_frequency - self.responsive_track_frequency) * perc_to_far
+
+
+def create_track_policy(env):
+    """
+    Build the track policy selected by the environment.
+    :param env: (Dictionary) Environment variables
+    :return: (TrackPolicy)
+    """
+    if env["ADAPTIVE_TRACKING"]:
+        return AdaptiveTrackPolicy(env)
+    else:
+        return TrackPolicy(env)
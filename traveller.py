@@ -1,72 +1,157 @@
 from Radar.radar_requests import RadarRequests
 from Network.street_graph import StreetGraph
+from track_policy import TrackPolicy
+from clock import SystemClock
 
-import time
 import numpy
 import math
 from random import randint
 import uuid
 
 
-class Traveler():
-
-    travelling = False
-    return_trip = False
-    stopped = False
-    stopped_clock = 0
-
-    ox_origin = None
-    ox_destination = None
-    ox_destinations = None
-
-    ox_start_edge_node = None
-    ox_end_edge_node = None
-    ox_node_route = []
-
-    cord_current_position = None
-
-    track_call_frequency = 0
-    last_track_request_clock = 0
-    always_track_on_nodes = False
-    always_track_on_geofence_nodes = False
+class TravelerProfile:
+    """
+    Settings shared by every Traveller of one travel mode. Travellers keep a reference to their profile instead of their
+    own copy of each environment variable, so adding a Traveller only costs its own state.
+    """
 
-    average_accuracy = 0
-    current_accuracy = 0
-
-    total_travel_time = 0
-    started_travel_on_edge_clock = 0
-    travel_mode = None
-    travel_speed = 0
-
-    min_dwell_time_seconds = 0
-    max_dwell_time_seconds = 0
-    dwell_time_at_destination = 0
-
-    def __init__(self, env, travel_mode, radar_requests: RadarRequests, street_graph: StreetGraph):
+    def __init__(self, env, travel_mode, radar_requests: RadarRequests, street_graph: StreetGraph, track_policy: TrackPolicy = None,
+                 clock=None):
         self.radar_requests = radar_requests
         self.street_graph = street_graph
 
+        if clock is None:
+            clock = SystemClock()
+        self.clock = clock
+
+        if track_policy is None:
+            track_policy = TrackPolicy(env)
+        self.track_policy = track_policy
+
         self.min_dwell_time_seconds = env["MIN_DWELL_TIME_SECONDS"]
         self.max_dwell_time_seconds = env["MAX_DWELL_TIME_SECONDS"]
 
         self.average_accuracy = env["AVERAGE_LOCATION_ACCURACY"]
-        self.current_accuracy = self.average_accuracy
 
         self.travel_mode = travel_mode
 
+        self.travel_speed = 0
         if self.travel_mode.lower() == "car":
             self.travel_speed = env["CAR_TRAVEL_SPEED_METERS_PER_SECOND"]
         elif self.travel_mode.lower() == "foot":
             self.travel_speed = env["FOOT_TRAVEL_SPEED_METERS_PER_SECOND"]
 
-        self.uuid = uuid.uuid4().hex[:8]
-        self.userId = env["USER_ID_PREFIX"] + self.uuid
-        self.deviceId = env["DEVICE_ID_PREFIX"] + self.uuid
+        self.user_id_prefix = env["USER_ID_PREFIX"]
+        self.device_id_prefix = env["DEVICE_ID_PREFIX"]
 
-        self.track_call_frequency = env["USER_TRACK_FREQUENCY"]
         self.always_track_on_nodes = env["ALWAYS_TRACK_ON_NODES"]
         self.always_track_on_geofence_nodes = env["ALWAYS_TRACK_ON_GEOFENCE_NODE"]
 
+        self.simulate_trips = env["SIMULATE_TRIPS"]
+
+
+class Traveler():
+    """
+    A simulated device moving through its street network.
+    Slotted and free of per instance copies of shared settings, since a run holds one per simulated user.
+    """
+
+    __slots__ = (
+        "profile",
+        "uuid",
+
+        "travelling",
+        "return_trip",
+        "stopped",
+        "stopped_clock",
+
+        "ox_origin",
+        "ox_destination",
+        "ox_destinations",
+
+        "ox_start_edge_node",
+        "ox_end_edge_node",
+        # Route tuple shared with the StreetGraph route cache, and the index of ox_end_edge_node in it
+        "ox_node_route",
+        "route_index",
+        # (Array) Travel time of every edge of ox_node_route
+        "edge_travel_times",
+
+        "cord_current_position",
+
+        "last_track_request_clock",
+        # Shadow of the fixed rate timer so the track policy can report calls saved
+        "fixed_rate_track_clock",
+
+        "inside_geofence",
+        "tracked_inside_geofence",
+
+        "current_accuracy",
+
+        "total_travel_time",
+        "started_travel_on_edge_clock",
+        "dwell_time_at_destination",
+
+        "trip_count",
+        # (trip ID, OSMNX destination node) while on a trip to a trip destination geofence
+        "active_trip"
+    )
+
+    def __init__(self, profile: TravelerProfile, traveller_id=None):
+        self.profile = profile
+
+        if traveller_id is None:
+            traveller_id = uuid.uuid4().hex[:8]
+        self.uuid = traveller_id
+
+        self.travelling = False
+        self.return_trip = False
+        self.stopped = False
+        self.stopped_clock = 0
+
+        self.ox_origin = None
+        self.ox_destination = None
+        self.ox_destinations = None
+
+        self.ox_start_edge_node = None
+        self.ox_end_edge_node = None
+        self.ox_node_route = ()
+        self.route_index = 0
+        self.edge_travel_times = None
+
+        self.cord_current_position = None
+
+        self.last_track_request_clock = 0
+        self.fixed_rate_track_clock = 0
+
+        self.inside_geofence = False
+        self.tracked_inside_geofence = False
+
+        self.current_accuracy = profile.average_accuracy
+
+        self.total_travel_time = 0
+        self.started_travel_on_edge_clock = 0
+        self.dwell_time_at_destination = 0
+
+        self.trip_count = 0
+        self.active_trip = None
+
+    @property
+    def street_graph(self):
+        return self.profile.street_graph
+
+    @property
+    def travel_mode(self):
+        return self.profile.travel_mode
+
+    @property
+    def userId(self):
+        return self.profile.user_id_prefix + self.uuid
+
+    @property
+    def deviceId(self):
+        return self.profile.device_id_prefix + self.uuid
+
     def start(self, ox_origin_node, ox_destination_nodes):
         """
         Initiate the traveller with their proper route and coordinates
@@ -92,20 +177,50 @@ class Traveler():
         """
         self.ox_node_route = self.street_graph.get_node_route(ox_start_node, ox_end_node)
 
-        self.ox_node_route.pop(0)
+        if len(self.ox_node_route) < 2:
+            self.setup_arrived(ox_start_node)
+            return
+
+        # Travel time for every edge of the route in one call, read edge by edge in swap_edges
+        self.edge_travel_times = self.street_graph.get_route_edge_meters(self.ox_node_route) / self.profile.travel_speed
+
+        self.route_index = 1
         self.ox_start_edge_node = ox_start_node
-        self.ox_end_edge_node = self.ox_node_route.pop(0)
+        self.ox_end_edge_node = self.ox_node_route[self.route_index]
 
         self.cord_current_position = self.street_graph.convert_ox_node_to_coordinate_pair(self.ox_start_edge_node)
+        # Before any forced track, so a track from inside a geofence counts its entry as tracked
+        self.update_geofence_proximity()
 
-        self.total_travel_time = self.calculate_travel_time_between_two_nodes(self.ox_start_edge_node, self.ox_end_edge_node)
-        self.dwell_time_at_destination = randint(self.min_dwell_time_seconds, self.max_dwell_time_seconds)
+        self.total_travel_time = float(self.edge_travel_times[0])
+        self.dwell_time_at_destination = randint(self.profile.min_dwell_time_seconds, self.profile.max_dwell_time_seconds)
 
-        self.started_travel_on_edge_clock = time.time()
+        self.started_travel_on_edge_clock = self.profile.clock.time()
 
         self.resolve_force_track_options()
         self.stopped = False
 
+        if self.profile.simulate_trips and self.street_graph.is_ox_node_trip_destination(ox_end_node):
+            self.start_trip(ox_end_node)
+
+    def setup_arrived(self, ox_node):
+        """
+        Handle a route that starts at its own destination by stopping there straight away.
+        :param ox_node: (OSMNX Node)
+        :return:
+        """
+        self.ox_node_route = ()
+        self.route_index = 0
+        self.edge_travel_times = None
+        self.ox_start_edge_node = ox_node
+        self.ox_end_edge_node = ox_node
+
+        self.cord_current_position = self.street_graph.convert_ox_node_to_coordinate_pair(ox_node)
+        self.dwell_time_at_destination = randint(self.profile.min_dwell_time_seconds, self.profile.max_dwell_time_seconds)
+
+        self.stopped = True
+        self.stopped_clock = self.profile.clock.time()
+
     def stop_update(self):
         """
         Handle stop behvaior when at a destination. This will lead to one of three outcomes:
@@ -120,7 +235,7 @@ class Traveler():
             else:
                 self.setup_return_trip()
         else:
-            current_dwell_time = time.time() - self.stopped_clock
+            current_dwell_time = self.profile.clock.time() - self.stopped_clock
             if current_dwell_time >= self.dwell_time_at_destination:
                 current_ox_node = self.ox_destination #We stopped here
                 self.ox_destination = self.ox_destinations.pop(0)
@@ -151,15 +266,18 @@ class Traveler():
         start_cord = self.street_graph.convert_ox_node_to_coordinate_pair(self.ox_start_edge_node)
         end_cord = self.street_graph.convert_ox_node_to_coordinate_pair(self.ox_end_edge_node)
 
-        time_passed_on_edge = time.time() - self.started_travel_on_edge_clock
+        time_passed_on_edge = self.profile.clock.time() - self.started_travel_on_edge_clock
         total_perc_edge_travelled = numpy.clip(time_passed_on_edge / self.total_travel_time, 0, 1.0)  # Percentage
 
         new_cords = self.lerp_cords(start_cord, end_cord, total_perc_edge_travelled)
         self.cord_current_position = new_cords
         self.update_accuracy()
 
-        delta_time_since_last_track_request = time.time() - self.last_track_request_clock
-        if delta_time_since_last_track_request >= self.track_call_frequency:
+        geofence_distance = self.update_geofence_proximity()
+        self.update_fixed_rate_track_clock()
+
+        delta_time_since_last_track_request = self.profile.clock.time() - self.last_track_request_clock
+        if delta_time_since_last_track_request >= self.profile.track_policy.get_track_frequency(geofence_distance):
             self.track()
 
         if total_perc_edge_travelled >= 1.0:
@@ -170,20 +288,25 @@ class Traveler():
         Traveller reached end of edge in node graph. Swap to next edge in route.
         :return:
         """
-        if len(self.ox_node_route) == 0:
+        if self.route_index >= len(self.ox_node_route) - 1:
             # Stop then track for event if geofence
             if self.street_graph.is_ox_node_geofence(self.ox_destination):
                 self.stopped = True
-                self.track()
-                self.stopped = False
-            self.stopped_clock = time.time()
+                self.track(forced=True)
+
+            if self.active_trip is not None:
+                self.complete_trip()
+
+            # Stay stopped so stop_update handles the dwell and next route
+            self.stopped = True
+            self.stopped_clock = self.profile.clock.time()
         else:
             print("\tMoving to new edge.")
+            self.route_index += 1
             self.ox_start_edge_node = self.ox_end_edge_node
-            self.ox_end_edge_node = self.ox_node_route.pop(0)
-            self.total_travel_time = self.calculate_travel_time_between_two_nodes(self.ox_start_edge_node,
-                                                                                  self.ox_end_edge_node)
-            self.started_travel_on_edge_clock = time.time()
+            self.ox_end_edge_node = self.ox_node_route[self.route_index]
+            self.total_travel_time = float(self.edge_travel_times[self.route_index - 1])
+            self.started_travel_on_edge_clock = self.profile.clock.time()
 
             self.resolve_force_track_options()
 
@@ -192,27 +315,56 @@ class Traveler():
         Helper function for force tracking depending on environment settings.
         :return:
         """
-        if self.always_track_on_nodes:
-            self.track()
-        elif self.always_track_on_geofence_nodes and self.street_graph.is_ox_node_geofence(self.ox_start_edge_node):
+        if self.profile.always_track_on_nodes:
+            self.track(forced=True)
+        elif self.profile.always_track_on_geofence_nodes and self.street_graph.is_ox_node_geofence(self.ox_start_edge_node):
             #Have to stop to ensure event generated in Radar
             self.stopped = True
-            self.track()
+            self.track(forced=True)
             self.stopped = False
 
-    def calculate_travel_time_between_two_nodes(self, ox_node_start, ox_node_end):
+    def start_trip(self, ox_destination_node):
+        """
+        Start a Radar trip to a trip destination geofence.
+        :param ox_destination_node: (OSMNX Node) Trip destination node
+        :return:
+        """
+        self.trip_count += 1
+        self.active_trip = (f"{self.uuid}_{self.trip_count}", ox_destination_node)
+
+        self.trip_update("started")
+
+    def complete_trip(self):
+        """
+        Complete the active Radar trip.
+        :return:
+        """
+        self.trip_update("completed")
+        self.active_trip = None
+
+    def trip_update(self, trip_status):
         """
-        Get the amount of time it will take for the travel to move between nodes based on travel mode and speed.
-        :param ox_node_start: (OSMNX Node)
-        :param ox_node_end: (OSMNX Node)
-        :return: (Float) travel time
+        Send a trip update for the active trip from the current position.
+        :param trip_status: (String) "started" or "completed"
+        :return:
         """
-        start_cord = self.street_graph.convert_ox_node_to_coordinate_pair(ox_node_start)
-        end_cord = self.street_graph.convert_ox_node_to_coordinate_pair(ox_node_end)
+        trip_id, ox_destination_node = self.active_trip
+        geofence_tag, geofence_external_id = self.street_graph.get_trip_destination_ids(ox_destination_node)
 
-        meters_between_coords = self.street_graph.get_meters_between_points(start_cord, end_cord)
+        print(f"Trip {trip_status.capitalize()}: {trip_id}")
 
-        return meters_between_coords / self.travel_speed
+        self.profile.radar_requests.trip_update(
+            trip_status,
+            {
+                "position": self.cord_current_position,
+                "deviceId": self.deviceId,
+                "userId": self.userId
+            },
+            geofence_tag,
+            geofence_external_id,
+            self.travel_mode.lower(),
+            trip_id=trip_id
+        )
 
     def lerp_cords(self, start_cords, end_cords, percentage):
         """
@@ -245,11 +397,36 @@ class Traveler():
         :return:
         """
         confidence_multiplier = self.street_graph.get_signal_confidence_from_nearest_tower(self.cord_current_position)
-        self.current_accuracy = int(math.ceil(self.average_accuracy * confidence_multiplier))
+        self.current_accuracy = int(math.ceil(self.profile.average_accuracy * confidence_multiplier))
 
-    def track(self):
+    def update_geofence_proximity(self):
+        """
+        Look up the nearest geofence and record real entries / exits for the tracking report.
+        :return: (Float) Meters to the nearest geofence edge
+        """
+        meters_to_center, radius = self.street_graph.get_nearest_geofence(self.cord_current_position)
+
+        inside = meters_to_center <= radius
+        if inside != self.inside_geofence:
+            self.profile.track_policy.geofence_transitions += 1
+            self.inside_geofence = inside
+
+        return max(meters_to_center - radius, 0)
+
+    def update_fixed_rate_track_clock(self):
+        """
+        Count the timed track a fixed rate Traveller would have made, whether or not the track policy makes it.
+        :return:
+        """
+        delta_time_since_fixed_rate_track = self.profile.clock.time() - self.fixed_rate_track_clock
+        if delta_time_since_fixed_rate_track >= self.profile.track_policy.fixed_track_frequency:
+            self.profile.track_policy.fixed_rate_track_calls += 1
+            self.fixed_rate_track_clock = self.profile.clock.time()
+
+    def track(self, forced=False):
         """
         Update the accuracy and the current position of the Traveller. Returns if we have reached our destination.
+        :param forced: (Bool) Track forced by environment settings. These are made under any track policy.
         :return: (Bool) Reached Destination
         """
 
@@ -263,7 +440,7 @@ class Traveler():
 
         print(f"Track Request: {track_request}")
 
-        self.radar_requests.track(
+        self.profile.radar_requests.track(
             {
                 "position": self.cord_current_position,
                 "deviceId": self.deviceId,
@@ -273,7 +450,16 @@ class Traveler():
             stopped=self.stopped
         )
 
-        self.last_track_request_clock = time.time()
+        self.last_track_request_clock = self.profile.clock.time()
+
+        self.profile.track_policy.track_calls += 1
+        if forced:
+            self.profile.track_policy.fixed_rate_track_calls += 1
+            self.fixed_rate_track_clock = self.last_track_request_clock
+
+        if self.inside_geofence != self.tracked_inside_geofence:
+            self.profile.track_policy.tracked_geofence_transitions += 1
+            self.tracked_inside_geofence = self.inside_geofence
 
 # import json
 # ENVIRONMENT_FILE = "./Environment.json"